@@ -1,5 +1,46 @@
+import asyncio
+import logging
+import threading
 import anthropic
-from typing import List, Optional, Dict, Any
+import httpx
+import orjson
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Process-wide Anthropic clients keyed by API key so every AIGenerator shares
+# one pooled httpx connection instead of repeating TCP/TLS setup
+_CLIENT_CACHE: Dict[str, anthropic.AsyncAnthropic] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+class HistoryCompressor:
+    """Bounds conversation history to a token budget before it is sent to Claude"""
+
+    # Rough characters-per-token ratio for English text; avoids a count_tokens
+    # API round trip on every request
+    CHARS_PER_TOKEN = 4
+    TRUNCATION_NOTE = "[Earlier conversation omitted]"
+
+    def __init__(self, max_tokens: int = 2000):
+        self.max_chars = max_tokens * self.CHARS_PER_TOKEN
+
+    def compress(self, history: Optional[str]) -> Optional[str]:
+        """
+        Keep the most recent part of the history that fits the budget.
+
+        Older turns are dropped at a line boundary so the kept turns stay
+        verbatim and the prompt size is constant no matter how long the
+        session runs.
+        """
+        if not history or len(history) <= self.max_chars:
+            return history
+
+        tail = history[-self.max_chars :]
+        newline = tail.find("\n")
+        if newline != -1:
+            tail = tail[newline + 1 :]
+        return f"{self.TRUNCATION_NOTE}\n{tail}"
 
 
 class AIGenerator:
@@ -46,19 +87,69 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Marker that lets Anthropic reuse the prefill of everything up to this block
+    CACHE_CONTROL = {"type": "ephemeral"}
+
+    # Static system prompt block, built once and shared by every request
+    SYSTEM_BLOCK = {
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": CACHE_CONTROL,
+    }
+
+    # Heading of the per-request history block; only the history is appended
+    HISTORY_PREFIX = "Previous conversation:\n"
+
+    TOOL_CHOICE_AUTO = {"type": "auto"}
+    TOOL_CHOICE_NONE = {"type": "none"}
+
+    def __init__(self, api_key: str, model: str, max_history_tokens: int = 2000):
+        self.client = self._get_client(api_key)
         self.model = model
+        self.history_compressor = HistoryCompressor(max_history_tokens)
 
-        # Pre-build base API parameters
+        # Pre-build base API parameters; the frozen items let each request
+        # build its params with a single dict() call instead of a ** merge
         self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
-
-    def generate_response(
+        self._base_items = tuple(self.base_params.items())
+
+    @staticmethod
+    def _get_client(api_key: str) -> anthropic.AsyncAnthropic:
+        """Return the shared Anthropic client for this API key, creating it once"""
+        with _CLIENT_CACHE_LOCK:
+            client = _CLIENT_CACHE.get(api_key)
+            if client is None:
+                client = anthropic.AsyncAnthropic(
+                    api_key=api_key,
+                    max_retries=2,
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                    # HTTP/2 multiplexes concurrent requests over one connection
+                    http_client=anthropic.DefaultAsyncHttpxClient(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=100, max_keepalive_connections=20
+                        ),
+                    ),
+                )
+                _CLIENT_CACHE[api_key] = client
+            return client
+
+    @classmethod
+    async def close_all(cls):
+        """Close all pooled Anthropic clients (call at application shutdown)"""
+        with _CLIENT_CACHE_LOCK:
+            clients = list(_CLIENT_CACHE.values())
+            _CLIENT_CACHE.clear()
+        for client in clients:
+            await client.close()
+
+    async def generate_response(
         self,
         query: str,
         conversation_history: Optional[str] = None,
         tools: Optional[List] = None,
         tool_manager=None,
+        sources: Optional[List[Dict[str, Any]]] = None,
     ) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
@@ -68,49 +159,227 @@ Provide only the direct answer to what was asked.
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
+            sources: Optional list that receives the sources of the tool calls
+                made for this request
 
         Returns:
             Generated response as string
         """
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
-
-        # Prepare API call parameters efficiently
-        api_params = {
-            **self.base_params,
-            "messages": [{"role": "user", "content": query}],
-            "system": system_content,
-        }
-
-        # Add tools if available
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        api_params = self._build_params(query, conversation_history, tools)
 
         # Get response from Claude
-        response = self.client.messages.create(**api_params)
+        response = await self.client.messages.create(**api_params)
 
         # Handle tool execution if needed
         if response.stop_reason == "tool_use" and tool_manager:
             # Use default max_rounds of 2, but could be made configurable
-            return self._handle_tool_execution(
-                response, api_params, tool_manager, max_rounds=2
+            return await self._handle_tool_execution(
+                response, api_params, tool_manager, max_rounds=2, sources=sources
             )
 
         # Return direct response
         return response.content[0].text
 
-    def _handle_tool_execution(
+    async def stream_response(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        max_rounds: int = 2,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the AI response as text chunks while it is being generated.
+
+        Tool rounds follow the same rules as generate_response: when a round
+        ends in tool_use the tools run, and the next round is streamed, with
+        tool use disabled once max_rounds is reached or when a tool_use stop
+        has no tool calls to run. Text Claude writes before calling tools is
+        not part of the answer generate_response returns, so once the next
+        round is certain such a round is followed by a discard event.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            max_rounds: Maximum number of tool calling rounds (default: 2)
+            sources: Optional list that receives the sources of the tool calls
+                made for this request
+
+        Yields:
+            {"type": "text", "text": ...} events as chunks arrive, and a
+            {"type": "discard"} event when the text since the previous discard
+            was preamble to a tool call rather than part of the answer
+        """
+        api_params = self._build_params(query, conversation_history, tools)
+        messages = api_params["messages"]
+        round_count = 0
+        result_cache = {}
+
+        while True:
+            streamed_text = False
+            async with self.client.messages.stream(**api_params) as stream:
+                async for text in stream.text_stream:
+                    streamed_text = True
+                    yield {"type": "text", "text": text}
+                message = await stream.get_final_message()
+
+            if message.stop_reason != "tool_use" or not tool_manager:
+                return
+
+            tool_results = await self._execute_tools(
+                message.content, tool_manager, result_cache, sources
+            )
+            if not tool_results and api_params.get("tool_choice") == (
+                self.TOOL_CHOICE_NONE
+            ):
+                # Already the final no-tools call: its text is the answer
+                return
+
+            # Another round follows, so the text so far was only preamble
+            if streamed_text:
+                yield {"type": "discard"}
+
+            if not tool_results:
+                # tool_use stop without tool_use blocks has nothing to feed
+                # back; ask for the answer without tools, as generate_response
+                api_params["tool_choice"] = self.TOOL_CHOICE_NONE
+                continue
+
+            round_count += 1
+            messages.append({"role": "assistant", "content": message.content})
+            messages.append({"role": "user", "content": tool_results})
+
+            # After the last allowed round Claude must answer without tools
+            if round_count >= max_rounds:
+                api_params["tool_choice"] = self.TOOL_CHOICE_NONE
+
+    def _build_params(
+        self,
+        query: str,
+        conversation_history: Optional[str],
+        tools: Optional[List],
+    ) -> Dict[str, Any]:
+        """Build the parameters for the first API call of a query"""
+        api_params = dict(
+            self._base_items,
+            messages=[{"role": "user", "content": query}],
+            system=self._build_system(conversation_history),
+        )
+
+        # Add tools if available
+        if tools:
+            api_params["tools"] = self._with_cached_tools(tools)
+            api_params["tool_choice"] = self.TOOL_CHOICE_AUTO
+
+        return api_params
+
+    def _build_system(self, conversation_history: Optional[str]) -> List[Dict]:
+        """
+        Build the system prompt as cacheable content blocks.
+
+        The static prompt and the conversation history are separate blocks so
+        the prompt prefix stays cached even as the history changes.
+        """
+        system = [self.SYSTEM_BLOCK]
+        conversation_history = self.history_compressor.compress(conversation_history)
+        if conversation_history:
+            system.append(
+                {
+                    "type": "text",
+                    "text": self.HISTORY_PREFIX + conversation_history,
+                    "cache_control": self.CACHE_CONTROL,
+                }
+            )
+        return system
+
+    def _with_cached_tools(self, tools: List[Dict]) -> List[Dict]:
+        """Mark the last tool definition so all tool schemas get cached"""
+        return [*tools[:-1], {**tools[-1], "cache_control": self.CACHE_CONTROL}]
+
+    async def _execute_tools(
+        self,
+        content: List,
+        tool_manager,
+        result_cache: Optional[
+            Dict[Tuple[str, bytes], Tuple[str, List[Dict[str, Any]]]]
+        ] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[Dict]:
+        """
+        Execute all tool calls of one response concurrently.
+
+        Tools are independent blocking vector searches, so each runs in a worker
+        thread and the round costs the slowest call rather than the sum.
+
+        Args:
+            content: Content blocks of the response requesting tools
+            tool_manager: Manager to execute tools
+            result_cache: Results and sources of earlier rounds of the same
+                request, keyed by tool name and canonical input; repeated calls
+                are served from it and new results are added
+            sources: Optional list extended with the sources of the calls, in
+                tool_use block order and including those served from
+                result_cache, skipping entries it already holds; tools return
+                them rather than leaving them on shared tool state, so
+                concurrent requests stay apart
+
+        Returns:
+            tool_result blocks in the same order as the tool_use blocks
+        """
+        if result_cache is None:
+            result_cache = {}
+
+        tool_uses = [block for block in content if block.type == "tool_use"]
+        keys = [
+            (block.name, orjson.dumps(block.input, option=orjson.OPT_SORT_KEYS))
+            for block in tool_uses
+        ]
+
+        # Run each distinct call once, including duplicates within this round
+        pending = {}
+        for key, block in zip(keys, tool_uses):
+            if key not in result_cache:
+                pending.setdefault(key, block)
+
+        outputs = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    tool_manager.execute_tool_with_sources, block.name, **block.input
+                )
+                for block in pending.values()
+            )
+        )
+        result_cache.update(zip(pending, outputs))
+
+        # gather returns results in call order whichever thread finishes first,
+        # and cached results carry their sources, so the sources follow the
+        # tool_use blocks rather than the scheduler or the round they ran in
+        if sources is not None:
+            for key in keys:
+                for source in result_cache[key][1]:
+                    if source not in sources:
+                        sources.append(source)
+
+        return [
+            {
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": result_cache[key][0],
+            }
+            for block, key in zip(tool_uses, keys)
+        ]
+
+    async def _handle_tool_execution(
         self,
         initial_response,
         base_params: Dict[str, Any],
         tool_manager,
         max_rounds: int = 2,
+        sources: Optional[List[Dict[str, Any]]] = None,
     ):
         """
         Handle execution of tool calls with support for sequential rounds.
@@ -120,14 +389,17 @@ Provide only the direct answer to what was asked.
             base_params: Base API parameters
             tool_manager: Manager to execute tools
             max_rounds: Maximum number of tool calling rounds (default: 2)
+            sources: Optional list that receives the sources of the tool calls
 
         Returns:
             Final response text after tool execution
         """
-        # Start with existing messages
-        messages = base_params["messages"].copy()
+        # base_params belongs to this request, so extend its messages and
+        # reuse the dict for every follow-up call instead of rebuilding it
+        messages = base_params["messages"]
         current_response = initial_response
         round_count = 0
+        result_cache = {}
 
         # Sequential tool execution loop
         while (
@@ -136,67 +408,43 @@ Provide only the direct answer to what was asked.
             and tool_manager
         ):
 
+            # Execute all tool calls in current round concurrently
+            tool_results = await self._execute_tools(
+                current_response.content, tool_manager, result_cache, sources
+            )
+
+            # A tool_use stop without tool_use blocks has nothing to feed back;
+            # skip further rounds and go straight to the final answer
+            if not tool_results:
+                break
+
             round_count += 1
 
-            # Add AI's tool use response to message history
+            # Add AI's tool use response and the tool results to message history
             messages.append({"role": "assistant", "content": current_response.content})
-
-            # Execute all tool calls in current round and collect results
-            tool_results = []
-            for content_block in current_response.content:
-                if content_block.type == "tool_use":
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, **content_block.input
-                    )
-
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": tool_result,
-                        }
-                    )
-
-            # Add tool results as user message
-            if tool_results:
-                messages.append({"role": "user", "content": tool_results})
+            messages.append({"role": "user", "content": tool_results})
 
             # Check if we've reached max rounds - if so, make final call without tools
             if round_count >= max_rounds:
                 break
 
-            # Prepare next API call with tools still available for potential next round
-            next_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": base_params["system"],
-                "tools": base_params.get("tools", []),
-                "tool_choice": {"type": "auto"},
-            }
-
             # Make next API call to see if Claude wants to use more tools
             try:
-                current_response = self.client.messages.create(**next_params)
-            except Exception as e:
+                current_response = await self.client.messages.create(**base_params)
+            except Exception:
                 # If API call fails, break the loop and generate final response
-                print(f"Error in tool execution round {round_count}: {e}")
+                logger.exception("Error in tool execution round %d", round_count)
                 break
 
-        # Generate final response without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": base_params["system"],
-        }
-
         # If we exited the loop due to no tool use, use the current response
         if current_response.stop_reason != "tool_use":
             return current_response.content[0].text
 
-        # Otherwise, make a final call without tools to get the synthesized response
-        try:
-            final_response = self.client.messages.create(**final_params)
-            return final_response.content[0].text
-        except Exception as e:
-            print(f"Error in final response generation: {e}")
-            return "I apologize, but I encountered an error while generating the final response."
+        # Otherwise, make a final call that may not use tools to get the
+        # synthesized response. Keeping the tool schemas leaves the cached
+        # prompt prefix intact; tool_choice "none" stops further tool calls.
+        # A failure here propagates like one on the first call, so callers
+        # never mistake an error for an answer (or cache it as one).
+        base_params["tool_choice"] = self.TOOL_CHOICE_NONE
+        final_response = await self.client.messages.create(**base_params)
+        return final_response.content[0].text
@@ -6,12 +6,19 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
+import orjson
+from pathlib import Path
 
 from config import config
 from rag_system import RAGSystem
+from ai_generator import AIGenerator
+
+# Frontend and course documents live next to backend/, whatever the cwd
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
 # Initialize FastAPI app
 app = FastAPI(title="Course Materials RAG System", root_path="")
@@ -71,13 +78,33 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
 
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
 
         return QueryResponse(answer=answer, sources=sources, session_id=session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/query/stream")
+async def stream_query(request: QueryRequest):
+    """Process a query and stream the answer as newline-delimited JSON events"""
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+
+    async def events():
+        try:
+            async for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "sources":
+                    event["session_id"] = session_id
+                yield orjson.dumps(event) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield orjson.dumps({"type": "error", "detail": str(e)}) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
@@ -94,7 +121,7 @@ async def get_course_stats():
 @app.on_event("startup")
 async def startup_event():
     """Load initial documents on startup"""
-    docs_path = "../docs"
+    docs_path = str(PROJECT_ROOT / "docs")
     if os.path.exists(docs_path):
         print("Loading initial documents...")
         try:
@@ -106,13 +133,13 @@ async def startup_event():
             print(f"Error loading documents: {e}")
 
 
-# Custom static file handler with no-cache headers for development
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import os
-from pathlib import Path
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled Anthropic connections on shutdown"""
+    await AIGenerator.close_all()
 
 
+# Custom static file handler with no-cache headers for development
 class DevStaticFiles(StaticFiles):
     async def get_response(self, path: str, scope):
         response = await super().get_response(path, scope)
@@ -125,4 +152,6 @@ class DevStaticFiles(StaticFiles):
 
 
 # Serve static files for the frontend
-app.mount("/", StaticFiles(directory="../frontend", html=True), name="static")
+app.mount(
+    "/", StaticFiles(directory=PROJECT_ROOT / "frontend", html=True), name="static"
+)
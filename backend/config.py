@@ -16,17 +16,30 @@ class Config:
 
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    # Optional ONNX export inside the model repo, run on ONNX Runtime (needs
+    # optimum[onnxruntime]), e.g. "onnx/model_qint8_avx512_vnni.onnx" for int8;
+    # empty string keeps PyTorch
+    EMBEDDING_ONNX_FILE: str = ""
 
     # Document processing settings
     CHUNK_SIZE: int = 800  # Size of text chunks for vector storage
     CHUNK_OVERLAP: int = 100  # Characters to overlap between chunks
     MAX_RESULTS: int = 5  # Maximum search results to return
     MAX_HISTORY: int = 2  # Number of conversation messages to remember
+    MAX_HISTORY_TOKENS: int = 2000  # Approximate token budget for history in prompts
 
     # Tool calling settings
     MAX_TOOL_ROUNDS: int = 2  # Maximum sequential tool calling rounds
     ENABLE_SEQUENTIAL_TOOLS: bool = True  # Enable/disable sequential tool calling
 
+    # Response cache settings
+    # Reuse answers for near-identical queries. Off by default: questions that
+    # differ only in a lesson or course number can still clear the threshold
+    ENABLE_RESPONSE_CACHE: bool = False
+    RESPONSE_CACHE_SIZE: int = 256  # Maximum cached answers
+    RESPONSE_CACHE_THRESHOLD: float = 0.95  # Minimum cosine similarity for a hit
+    RESPONSE_CACHE_TTL: int = 3600  # Seconds before a cached answer expires
+
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
 
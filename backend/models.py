@@ -1,10 +1,12 @@
 from typing import List, Dict, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class Lesson(BaseModel):
     """Represents a lesson within a course"""
 
+    model_config = ConfigDict(frozen=True)
+
     lesson_number: int  # Sequential lesson number (1, 2, 3, etc.)
     title: str  # Lesson title
     lesson_link: Optional[str] = None  # URL link to the lesson
@@ -13,6 +15,8 @@ class Lesson(BaseModel):
 class Course(BaseModel):
     """Represents a complete course with its lessons"""
 
+    model_config = ConfigDict(frozen=True)
+
     title: str  # Full course title (used as unique identifier)
     course_link: Optional[str] = None  # URL link to the course
     instructor: Optional[str] = None  # Course instructor name (optional metadata)
@@ -22,6 +26,8 @@ class Course(BaseModel):
 class CourseChunk(BaseModel):
     """Represents a text chunk from a course for vector storage"""
 
+    model_config = ConfigDict(frozen=True)
+
     content: str  # The actual text content
     course_title: str  # Which course this chunk belongs to
     lesson_number: Optional[int] = None  # Which lesson this chunk is from
@@ -1,10 +1,12 @@
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator
 import os
+import asyncio
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
 from ai_generator import AIGenerator
 from session_manager import SessionManager
 from search_tools import ToolManager, CourseSearchTool, CourseOutlineTool
+from response_cache import ResponseCache
 from models import Course, Lesson, CourseChunk
 
 
@@ -19,10 +21,15 @@ class RAGSystem:
             config.CHUNK_SIZE, config.CHUNK_OVERLAP
         )
         self.vector_store = VectorStore(
-            config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
+            config.CHROMA_PATH,
+            config.EMBEDDING_MODEL,
+            config.MAX_RESULTS,
+            onnx_file=config.EMBEDDING_ONNX_FILE,
         )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            config.MAX_HISTORY_TOKENS,
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
@@ -33,6 +40,16 @@ class RAGSystem:
         self.tool_manager.register_tool(self.search_tool)
         self.tool_manager.register_tool(self.outline_tool)
 
+        # Semantic cache for answers, sharing the vector store's embedder
+        self.response_cache = None
+        if config.ENABLE_RESPONSE_CACHE:
+            self.response_cache = ResponseCache(
+                self.vector_store.embedding_function,
+                max_size=config.RESPONSE_CACHE_SIZE,
+                similarity_threshold=config.RESPONSE_CACHE_THRESHOLD,
+                ttl_seconds=config.RESPONSE_CACHE_TTL,
+            )
+
     def add_course_document(self, file_path: str) -> Tuple[Course, int]:
         """
         Add a single course document to the knowledge base.
@@ -55,6 +72,10 @@ class RAGSystem:
             # Add course content chunks to vector store
             self.vector_store.add_course_content(course_chunks)
 
+            # Cached answers predate the new content
+            if self.response_cache:
+                self.response_cache.clear()
+
             return course, len(course_chunks)
         except Exception as e:
             print(f"Error processing course document {file_path}: {e}")
@@ -73,9 +94,6 @@ class RAGSystem:
         Returns:
             Tuple of (total courses added, total chunks created)
         """
-        total_courses = 0
-        total_chunks = 0
-
         # Clear existing data if requested
         if clear_existing:
             print("Clearing existing data for fresh rebuild...")
@@ -87,6 +105,8 @@ class RAGSystem:
 
         # Get existing course titles to avoid re-processing
         existing_course_titles = set(self.vector_store.get_existing_course_titles())
+        # New courses are queued and added in batches, so they embed together
+        new_courses = []  # (course, chunks) pairs, at most one per title
 
         # Process each file in the folder
         for file_name in os.listdir(folder_path):
@@ -102,23 +122,59 @@ class RAGSystem:
                     )
 
                     if course and course.title not in existing_course_titles:
-                        # This is a new course - add it to the vector store
-                        self.vector_store.add_course_metadata(course)
-                        self.vector_store.add_course_content(course_chunks)
-                        total_courses += 1
-                        total_chunks += len(course_chunks)
-                        print(
-                            f"Added new course: {course.title} ({len(course_chunks)} chunks)"
-                        )
+                        # This is a new course - queue it for the vector store;
+                        # its title also skips later files with the same course
+                        new_courses.append((course, course_chunks))
                         existing_course_titles.add(course.title)
                     elif course:
                         print(f"Course already exists: {course.title} - skipping")
                 except Exception as e:
                     print(f"Error processing {file_name}: {e}")
 
-        return total_courses, total_chunks
+        added_courses = self._add_courses(new_courses)
+        for course, course_chunks in added_courses:
+            print(f"Added new course: {course.title} ({len(course_chunks)} chunks)")
+
+        # Cached answers predate the cleared or added content
+        if self.response_cache and (clear_existing or added_courses):
+            self.response_cache.clear()
+
+        total_chunks = sum(len(course_chunks) for _, course_chunks in added_courses)
+        return len(added_courses), total_chunks
+
+    def _add_courses(
+        self, courses: List[Tuple[Course, List[CourseChunk]]]
+    ) -> List[Tuple[Course, List[CourseChunk]]]:
+        """
+        Add queued courses to the vector store, batching them where possible.
+
+        If a batch add fails the courses are retried one at a time, so one bad
+        document only loses its own course. Re-adding the IDs a failed batch
+        already stored is a no-op in ChromaDB.
+
+        Returns:
+            The (course, chunks) pairs that were added
+        """
+        try:
+            self.vector_store.add_courses([course for course, _ in courses])
+            self.vector_store.add_course_content(
+                [chunk for _, course_chunks in courses for chunk in course_chunks]
+            )
+            return courses
+        except Exception as e:
+            print(f"Batch add failed, adding courses one at a time: {e}")
 
-    def query(
+        added = []
+        for course, course_chunks in courses:
+            try:
+                self.vector_store.add_course_metadata(course)
+                self.vector_store.add_course_content(course_chunks)
+                added.append((course, course_chunks))
+            except Exception as e:
+                print(f"Error adding course {course.title}: {e}")
+        return added
+
+    async def query(
         self, query: str, session_id: Optional[str] = None
     ) -> Tuple[str, List[str]]:
         """
@@ -139,19 +195,29 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
-            query=prompt,
-            conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager,
-        )
+        # Serve semantically equivalent questions from the response cache
+        cached = None
+        if self.response_cache:
+            embedding = await asyncio.to_thread(self.response_cache.embed, query)
+            cached = self.response_cache.get(embedding, history)
 
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
+        if cached:
+            response, sources = cached
+        else:
+            # Generate response using AI with tools; sources are collected for
+            # this request only, so concurrent queries never see each other's
+            sources = []
+            response = await self.ai_generator.generate_response(
+                query=prompt,
+                conversation_history=history,
+                tools=self.tool_manager.get_tool_definitions(),
+                tool_manager=self.tool_manager,
+                sources=sources,
+            )
 
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+            # Errors raise before reaching here; an empty answer is no answer
+            if self.response_cache and response:
+                self.response_cache.put(embedding, history, response, sources)
 
         # Update conversation history
         if session_id:
@@ -160,6 +226,64 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
 
+    async def query_stream(
+        self, query: str, session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user query and stream the answer as it is generated.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Yields:
+            {"type": "text", "text": ...} events for each answer chunk, followed
+            by a single {"type": "sources", "sources": [...]} event. A
+            {"type": "discard"} event means the text so far was preamble to a
+            tool call and is not part of the answer
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        cached = None
+        if self.response_cache:
+            embedding = await asyncio.to_thread(self.response_cache.embed, query)
+            cached = self.response_cache.get(embedding, history)
+
+        if cached:
+            response, sources = cached
+            yield {"type": "text", "text": response}
+        else:
+            chunks = []
+            sources = []
+            async for event in self.ai_generator.stream_response(
+                query=prompt,
+                conversation_history=history,
+                tools=self.tool_manager.get_tool_definitions(),
+                tool_manager=self.tool_manager,
+                sources=sources,
+            ):
+                # Only the text after the last discard is the answer, matching
+                # what query returns and what gets stored and cached
+                if event["type"] == "discard":
+                    chunks.clear()
+                else:
+                    chunks.append(event["text"])
+                yield event
+            response = "".join(chunks)
+
+            # Errors raise before reaching here; an empty answer is no answer
+            if self.response_cache and response:
+                self.response_cache.put(embedding, history, response, sources)
+
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+
+        yield {"type": "sources", "sources": sources}
+
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass(eq=False)
+class CacheEntry:
+    """A cached answer together with the query embedding that produced it"""
+
+    embedding: np.ndarray  # Unit-normalized query embedding
+    history_key: int  # Hash of the conversation history the answer depends on
+    answer: str
+    sources: List[Dict[str, Any]]
+    created_at: float
+    last_used: float
+    hits: int = 0
+
+
+class ResponseCache:
+    """Semantic cache returning prior answers for near-identical questions"""
+
+    def __init__(
+        self,
+        embedding_function: Callable[[List[str]], Any],
+        max_size: int = 256,
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+    ):
+        self.embedding_function = embedding_function
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.entries: List[CacheEntry] = []
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed a query and normalize it so a dot product is cosine similarity"""
+        vector = np.asarray(self.embedding_function([query])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(
+        self, embedding: np.ndarray, conversation_history: Optional[str]
+    ) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Look up a cached answer for a query embedding.
+
+        Only entries created with the same conversation history are considered,
+        so a follow-up question is never answered out of context.
+
+        Returns:
+            Tuple of (answer, sources) on a hit, otherwise None
+        """
+        self._evict_expired()
+
+        history_key = hash(conversation_history)
+        candidates = [e for e in self.entries if e.history_key == history_key]
+        if not candidates:
+            return None
+
+        similarities = np.stack([e.embedding for e in candidates]) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        entry = candidates[best]
+        entry.hits += 1
+        entry.last_used = time.monotonic()
+        return entry.answer, list(entry.sources)
+
+    def put(
+        self,
+        embedding: np.ndarray,
+        conversation_history: Optional[str],
+        answer: str,
+        sources: List[Dict[str, Any]],
+    ):
+        """Store an answer, evicting the least popular entry when full"""
+        self._evict_expired()
+
+        if len(self.entries) >= self.max_size:
+            # Least hits first, least recently used among equally popular entries
+            victim = min(self.entries, key=lambda e: (e.hits, e.last_used))
+            self.entries.remove(victim)
+
+        now = time.monotonic()
+        self.entries.append(
+            CacheEntry(
+                embedding=embedding,
+                history_key=hash(conversation_history),
+                answer=answer,
+                sources=list(sources),
+                created_at=now,
+                last_used=now,
+            )
+        )
+
+    def clear(self):
+        """Remove all cached answers"""
+        self.entries = []
+
+    def _evict_expired(self):
+        """Drop entries older than the configured TTL"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        self.entries = [e for e in self.entries if e.created_at >= cutoff]
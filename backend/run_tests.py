@@ -1,81 +1,106 @@
 #!/usr/bin/env python3
 """
 Test runner for the RAG system backend tests.
-Runs all tests and provides clear output about failures.
+Runs all tests in parallel with pytest-xdist, including the slow ones plain
+pytest deselects, and provides clear output about failures.
 """
 
-import unittest
 import sys
 import os
-from io import StringIO
+import importlib.util
+
+
+class SummaryPlugin:
+    """Collects per-test outcomes so the runner can print its own summary"""
+
+    def __init__(self):
+        self.passed = 0
+        self.skipped = 0
+        self.failures = []
+        self.errors = []
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            # Failures in setup/teardown are errors, like unittest reports them
+            target = self.failures if report.when == "call" else self.errors
+            target.append((report.nodeid, report.longreprtext))
+        elif report.skipped:
+            self.skipped += 1
+        elif report.when == "call":
+            self.passed += 1
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.errors.append((report.nodeid, report.longreprtext))
 
 
 def run_tests():
     """Run all tests and return results"""
+    import pytest
+
+    # -m "" overrides the default "not slow" selection so the runner covers
+    # the Chroma-backed integration tests too
+    args = ["tests", "-q", "-p", "no:cacheprovider", "-m", ""]
 
-    # Discover and run tests
-    test_loader = unittest.TestLoader()
-    test_suite = test_loader.discover("tests", pattern="test_*.py")
+    # Spread tests across all CPUs when pytest-xdist is available; each worker
+    # gets its own ChromaDB directory (see conftest), so slow integration tests
+    # can run side by side instead of queueing behind one file
+    if importlib.util.find_spec("xdist"):
+        args += ["-n", "auto", "--dist=loadgroup"]
 
-    # Create a test runner with detailed output
-    stream = StringIO()
-    test_runner = unittest.TextTestRunner(
-        stream=stream, verbosity=2, descriptions=True, failfast=False
-    )
+    summary = SummaryPlugin()
 
     print("=" * 70)
     print("RUNNING RAG SYSTEM BACKEND TESTS")
     print("=" * 70)
 
-    # Run the tests
-    result = test_runner.run(test_suite)
-
-    # Get the output
-    output = stream.getvalue()
-    print(output)
+    # Run the tests; the exit code also covers problems the summary plugin
+    # never sees, such as usage errors, interruptions or nothing collected
+    exit_code = pytest.main(args, plugins=[summary])
 
     # Print summary
     print("\n" + "=" * 70)
     print("TEST SUMMARY")
     print("=" * 70)
 
-    total_tests = result.testsRun
-    failures = len(result.failures)
-    errors = len(result.errors)
-    skipped = len(result.skipped) if hasattr(result, "skipped") else 0
-    successful = total_tests - failures - errors - skipped
+    failures = len(summary.failures)
+    errors = len(summary.errors)
+    total_tests = summary.passed + failures + summary.skipped
 
     print(f"Total tests run: {total_tests}")
-    print(f"Successful: {successful}")
+    print(f"Successful: {summary.passed}")
     print(f"Failures: {failures}")
     print(f"Errors: {errors}")
-    print(f"Skipped: {skipped}")
+    print(f"Skipped: {summary.skipped}")
 
-    if result.failures:
+    if summary.failures:
         print("\nFAILURES:")
         print("-" * 50)
-        for test, traceback in result.failures:
+        for test, traceback in summary.failures:
             print(f"FAILED: {test}")
             print(f"Traceback:\n{traceback}")
             print("-" * 50)
 
-    if result.errors:
+    if summary.errors:
         print("\nERRORS:")
         print("-" * 50)
-        for test, traceback in result.errors:
+        for test, traceback in summary.errors:
             print(f"ERROR: {test}")
             print(f"Traceback:\n{traceback}")
             print("-" * 50)
 
     # Return success status
-    success = failures == 0 and errors == 0
+    success = exit_code == pytest.ExitCode.OK and failures == 0 and errors == 0
 
     if success:
         print("\n🎉 ALL TESTS PASSED! 🎉")
         return 0
-    else:
+    elif failures or errors:
         print(f"\n❌ {failures + errors} tests failed or had errors")
         return 1
+    else:
+        print(f"\n❌ pytest exited with {pytest.ExitCode(exit_code).name}")
+        return 1
 
 
 if __name__ == "__main__":
@@ -83,8 +108,5 @@ if __name__ == "__main__":
     backend_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(backend_dir)
 
-    # Add backend to Python path
-    sys.path.insert(0, backend_dir)
-
     exit_code = run_tests()
     sys.exit(exit_code)
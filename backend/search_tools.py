@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, Protocol
+from typing import Dict, Any, List, Optional, Protocol, Tuple
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
 
@@ -16,6 +16,10 @@ class Tool(ABC):
         """Execute the tool with given parameters"""
         pass
 
+    def execute_with_sources(self, **kwargs) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute the tool and also return the sources its result came from"""
+        return self.execute(**kwargs), []
+
 
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
@@ -66,6 +70,26 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        result, sources = self.execute_with_sources(query, course_name, lesson_number)
+        if sources:
+            self.last_sources = sources
+        return result
+
+    def execute_with_sources(
+        self,
+        query: str,
+        course_name: Optional[str] = None,
+        lesson_number: Optional[int] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Search like execute, returning the sources instead of storing them.
+
+        Concurrent requests share one tool instance, so callers that need the
+        sources of their own search must take them from the return value.
+
+        Returns:
+            Tuple of (formatted search results or error message, sources)
+        """
 
         # Use the vector store's unified search interface
         results = self.store.search(
@@ -74,7 +98,7 @@ class CourseSearchTool(Tool):
 
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
 
         # Handle empty results
         if results.is_empty():
@@ -83,12 +107,14 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
 
         # Format and return results
         return self._format_results(results)
 
-    def _format_results(self, results: SearchResults) -> str:
+    def _format_results(
+        self, results: SearchResults
+    ) -> Tuple[str, List[Dict[str, Any]]]:
         """Format search results with course and lesson context"""
         formatted = []
         sources = []  # Track sources for the UI with link information
@@ -124,10 +150,7 @@ class CourseSearchTool(Tool):
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
-
-        return "\n\n".join(formatted)
+        return "\n\n".join(formatted), sources
 
 
 class CourseOutlineTool(Tool):
@@ -203,6 +226,9 @@ class ToolManager:
 
     def __init__(self):
         self.tools = {}
+        # Tool name -> bound method, so a call is one lookup and a direct call
+        self.handlers = {}
+        self.source_handlers = {}
 
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -211,6 +237,12 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        # Rebuilt from tools on every registration, so the tables always
+        # match self.tools even if it was replaced
+        self.handlers = {name: t.execute for name, t in self.tools.items()}
+        self.source_handlers = {
+            name: t.execute_with_sources for name, t in self.tools.items()
+        }
 
     def get_tool_definitions(self) -> list:
         """Get all tool definitions for Anthropic tool calling"""
@@ -218,13 +250,29 @@ class ToolManager:
 
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
-        if tool_name not in self.tools:
+        handler = self.handlers.get(tool_name)
+        if handler is None:
             return f"Tool '{tool_name}' not found"
 
-        return self.tools[tool_name].execute(**kwargs)
+        return handler(**kwargs)
+
+    def execute_tool_with_sources(
+        self, tool_name: str, **kwargs
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute a tool by name, returning its result and the sources it used"""
+        handler = self.source_handlers.get(tool_name)
+        if handler is None:
+            return f"Tool '{tool_name}' not found", []
+
+        return handler(**kwargs)
 
     def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
+        """
+        Get sources from the last search operation.
+
+        Tools are shared between requests, so this only suits sequential use;
+        concurrent callers should use execute_tool_with_sources instead.
+        """
         # Check all tools for last_sources attribute
         for tool in self.tools.values():
             if hasattr(tool, "last_sources") and tool.last_sources:
@@ -2,18 +2,120 @@
 Shared test fixtures for the RAG system tests
 """
 import pytest
-import tempfile
 import os
+import json
+import tempfile
+from collections import deque
+from types import SimpleNamespace
 from unittest.mock import Mock, AsyncMock
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-# Import required modules for testing
-import sys
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
-from config import Config
+import ai_generator
+from ai_generator import AIGenerator
+from config import Config, config as app_config
 from models import Course, Lesson, CourseChunk
+from vector_store import VectorStore
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+
+
+_app_chroma_dir = None
+
+
+def pytest_configure(config):
+    """Point the app's ChromaDB at a per-worker directory before app is imported"""
+    global _app_chroma_dir
+    # Every xdist worker imports app (and so builds a RAGSystem) at collection
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "master")
+    _app_chroma_dir = tempfile.TemporaryDirectory(
+        prefix=f"chroma_{worker_id}_", ignore_cleanup_errors=True
+    )
+    app_config.CHROMA_PATH = _app_chroma_dir.name
+
+
+def pytest_unconfigure(config):
+    """Remove the per-worker ChromaDB directory"""
+    _app_chroma_dir.cleanup()
+
+
+@pytest.fixture(scope="session")
+def embedding_model():
+    """Sentence transformer for tests that embed for real; small unless overridden"""
+    return os.environ.get("TEST_EMBED_MODEL", "paraphrase-MiniLM-L3-v2")
+
+
+@pytest.fixture(scope="session")
+def golden_chroma_dir(tmp_path_factory, embedding_model):
+    """ChromaDB directory with the shared course fixtures, ingested once per session"""
+    # Not xdist's worker_id fixture: run_tests.py treats xdist as optional
+    worker_id = os.environ.get("PYTEST_XDIST_WORKER", "master")
+    path = str(tmp_path_factory.mktemp(f"chroma_golden_{worker_id}") / "chroma")
+    # A handful of documents needs nowhere near the default HNSW search breadth
+    vector_store = VectorStore(
+        path,
+        embedding_model,
+        hnsw_ef=8,
+        onnx_file=app_config.EMBEDDING_ONNX_FILE,
+    )
+
+    courses = [
+        Course(
+            title="Python Fundamentals",
+            instructor="Python Expert",
+            lessons=[
+                Lesson(lesson_number=1, title="Variables and Data Types"),
+                Lesson(lesson_number=2, title="Functions and Modules"),
+                Lesson(lesson_number=3, title="Object-Oriented Programming"),
+            ],
+        ),
+        Course(
+            title="Java Basics",
+            instructor="Java Master",
+            lessons=[
+                Lesson(lesson_number=1, title="Java Syntax"),
+                Lesson(lesson_number=2, title="Classes and Objects"),
+            ],
+        ),
+        Course(title="Test Course", lessons=[]),
+        Course(title="Programming Course", lessons=[]),
+    ]
+    chunks = [
+        CourseChunk(
+            content="Variables in Python store data values. Python has different data types like int, float, string.",
+            course_title="Python Fundamentals",
+            lesson_number=1,
+            chunk_index=0,
+        ),
+        CourseChunk(
+            content="Functions in Python are defined with def keyword. Modules help organize code.",
+            course_title="Python Fundamentals",
+            lesson_number=2,
+            chunk_index=1,
+        ),
+        CourseChunk(
+            content="Java syntax is similar to C++. Every Java program starts with a class definition.",
+            course_title="Java Basics",
+            lesson_number=1,
+            chunk_index=0,
+        ),
+        CourseChunk(
+            content="Test content about programming",
+            course_title="Test Course",
+            chunk_index=0,
+        ),
+        CourseChunk(
+            content="Various programming concepts",
+            course_title="Programming Course",
+            chunk_index=0,
+        ),
+    ]
+
+    # One batched embed per collection; tests open this store read-only
+    # instead of re-encoding the corpus
+    vector_store.add_courses(courses)
+    vector_store.add_course_content(chunks)
+    return path
 
 
 @pytest.fixture
@@ -29,7 +131,7 @@ def mock_config():
     return config
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_data():
     """Sample course data for testing"""
     return {
@@ -51,7 +153,7 @@ def sample_course_data():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course(sample_course_data):
     """Sample Course model instance"""
     lessons = [
@@ -70,7 +172,7 @@ def sample_course(sample_course_data):
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_chunks():
     """Sample course chunks for testing vector operations"""
     return [
@@ -137,13 +239,14 @@ def mock_ai_generator():
     return mock_generator
 
 
-@pytest.fixture
-def temporary_docs_folder():
-    """Create a temporary folder with sample document files for testing"""
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create sample course file
-        course_file = Path(temp_dir) / "test_course.txt"
-        course_content = """Course Title: Test Course
+@pytest.fixture(scope="session")
+def temporary_docs_folder(tmp_path_factory):
+    """Create a temporary folder with sample document files for testing (read-only, shared)"""
+    temp_dir = tmp_path_factory.mktemp("docs")
+
+    # Create sample course file
+    course_file = temp_dir / "test_course.txt"
+    course_content = """Course Title: Test Course
 Course Link: https://example.com/course
 Course Instructor: Test Instructor
 
@@ -155,11 +258,11 @@ Lesson 2: Advanced Topics
 Lesson Link: https://example.com/lesson2
 This lesson covers advanced topics and practical examples.
 """
-        course_file.write_text(course_content)
-        yield temp_dir
+    course_file.write_text(course_content)
+    return str(temp_dir)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_request():
     """Sample query request data for API testing"""
     return {
@@ -168,7 +271,7 @@ def sample_query_request():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_response():
     """Sample query response data for API testing"""
     return {
@@ -186,7 +289,7 @@ def sample_query_response():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course_stats():
     """Sample course statistics for API testing"""
     return {
@@ -205,14 +308,61 @@ def mock_anthropic_client():
     return mock_client
 
 
+class ReplayAnthropicClient:
+    """Stand-in for AsyncAnthropic that replays queued responses in order"""
+
+    def __init__(self):
+        self.responses = deque()
+        self.messages = SimpleNamespace(create=AsyncMock(side_effect=self._next_response))
+
+    def add_response(
+        self,
+        text: Optional[str] = None,
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        stop_reason: Optional[str] = None,
+    ):
+        """Queue a response made of optional text followed by tool_use blocks"""
+        content = [{"type": "text", "text": text}] if text is not None else []
+        content += [{"type": "tool_use", **call} for call in tool_calls or []]
+        if stop_reason is None:
+            stop_reason = "tool_use" if tool_calls else "end_turn"
+        self._queue({"content": content, "stop_reason": stop_reason})
+
+    def load_cassette(self, name: str):
+        """Queue every response recorded in tests/cassettes/<name>.json"""
+        with open(CASSETTE_DIR / f"{name}.json") as f:
+            for response in json.load(f):
+                self._queue(response)
+
+    def _queue(self, response: Dict[str, Any]):
+        self.responses.append(
+            SimpleNamespace(
+                content=[SimpleNamespace(**block) for block in response["content"]],
+                stop_reason=response["stop_reason"],
+            )
+        )
+
+    async def _next_response(self, **kwargs):
+        if not self.responses:
+            raise AssertionError("No recorded Anthropic response left to replay")
+        return self.responses.popleft()
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+async def mock_anthropic(monkeypatch):
+    """Replaying Anthropic client installed for every AIGenerator built in the test"""
+    client = ReplayAnthropicClient()
+    monkeypatch.setattr(ai_generator.anthropic, "AsyncAnthropic", lambda *args, **kwargs: client)
+    yield client
+    await AIGenerator.close_all()
+
+
 @pytest.fixture(autouse=True)
 def setup_test_environment():
     """Automatically setup test environment for each test"""
-    # Ensure we're in the backend directory for imports
-    backend_path = Path(__file__).parent.parent
-    if str(backend_path) not in sys.path:
-        sys.path.insert(0, str(backend_path))
-    
     # Set test environment variables
     os.environ["TESTING"] = "1"
     yield
@@ -1,604 +1,846 @@
-import sys
-import os
-import unittest
-from unittest.mock import Mock, MagicMock, patch, call
+import logging
+import time
+import pytest
+from unittest.mock import Mock, MagicMock, AsyncMock, patch, call
 import json
+from dataclasses import dataclass
+from itertools import chain
+from types import SimpleNamespace
 
-# Add the parent directory to sys.path to import modules
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+import ai_generator
 from ai_generator import AIGenerator
 
 
+def _build_tool_block(tool_call):
+    """Build a tool_use content block from a tool call spec"""
+    return SimpleNamespace(
+        type="tool_use",
+        name=tool_call["name"],
+        input=tool_call["input"],
+        id=tool_call.get("id", "tool_call_1"),
+    )
+
+
 class MockAnthropicResponse:
     """Mock response from Anthropic API"""
 
     def __init__(self, content, stop_reason="end_turn", tool_calls=None):
-        self.content = (
-            content if isinstance(content, list) else [Mock(text=content, type="text")]
-        )
+        if not isinstance(content, list):
+            content = (SimpleNamespace(text=content, type="text"),)
+        # Text blocks followed by tool use blocks, materialized once
+        self.content = tuple(chain(content, map(_build_tool_block, tool_calls or ())))
         self.stop_reason = stop_reason
 
-        if tool_calls:
-            # Add tool use blocks to content
-            for tool_call in tool_calls:
-                tool_block = Mock()
-                tool_block.type = "tool_use"
-                tool_block.name = tool_call["name"]
-                tool_block.input = tool_call["input"]
-                tool_block.id = tool_call.get("id", "tool_call_1")
-                self.content.append(tool_block)
 
+def search_tool_response(query, call_id, **extra_input):
+    """Tool-use-only response making one search_course_content call"""
+    return MockAnthropicResponse(
+        content=[],
+        stop_reason="tool_use",
+        tool_calls=[
+            {
+                "name": "search_course_content",
+                "input": {"query": query, **extra_input},
+                "id": call_id,
+            }
+        ],
+    )
 
-class TestAIGenerator(unittest.TestCase):
-    """Test suite for AIGenerator CourseSearchTool integration"""
 
-    def setUp(self):
-        """Set up test fixtures"""
-        self.api_key = "test_api_key"
-        self.model = "claude-sonnet-4-20250514"
+@dataclass(frozen=True, slots=True)
+class ToolBlock:
+    """Slotted tool_use content block"""
 
-        # Mock the Anthropic client
-        self.mock_anthropic_client = Mock()
+    type: str
+    name: str
+    input: dict
+    id: str
 
-        with patch("ai_generator.anthropic.Anthropic") as mock_anthropic:
-            mock_anthropic.return_value = self.mock_anthropic_client
-            self.ai_generator = AIGenerator(self.api_key, self.model)
 
-    def test_generate_response_without_tools(self):
-        """Test response generation without tools"""
-        # Mock API response
-        mock_response = MockAnthropicResponse("This is a direct response without tools")
-        self.mock_anthropic_client.messages.create.return_value = mock_response
+@dataclass(frozen=True, slots=True)
+class MockResponse:
+    """Slotted API response holding prebuilt content blocks"""
 
-        result = self.ai_generator.generate_response("What is Python?")
+    content: list
+    stop_reason: str
 
-        # Verify API was called correctly
-        self.mock_anthropic_client.messages.create.assert_called_once()
-        call_args = self.mock_anthropic_client.messages.create.call_args
 
-        # Check basic parameters
-        self.assertEqual(call_args.kwargs["model"], self.model)
-        self.assertEqual(call_args.kwargs["temperature"], 0)
-        self.assertEqual(call_args.kwargs["max_tokens"], 800)
+class MockAnthropicStream:
+    """Mock of the async context manager returned by messages.stream"""
 
-        # Check message content
-        messages = call_args.kwargs["messages"]
-        self.assertEqual(len(messages), 1)
-        self.assertEqual(messages[0]["role"], "user")
-        self.assertEqual(messages[0]["content"], "What is Python?")
+    def __init__(self, chunks, final_message):
+        self.chunks = chunks
+        self.final_message = final_message
 
-        # Check system prompt
-        self.assertIn("course materials", call_args.kwargs["system"])
+    async def __aenter__(self):
+        return self
 
-        self.assertEqual(result, "This is a direct response without tools")
+    async def __aexit__(self, *exc_info):
+        return False
 
-    def test_generate_response_with_tools_no_tool_use(self):
-        """Test response with tools available but not used"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search course materials",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            }
-        ]
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            yield chunk
 
-        mock_response = MockAnthropicResponse("Direct answer without using tools")
-        self.mock_anthropic_client.messages.create.return_value = mock_response
+    async def get_final_message(self):
+        return self.final_message
 
-        result = self.ai_generator.generate_response("What is 2+2?", tools=mock_tools)
 
-        # Verify tools were provided in API call
-        call_args = self.mock_anthropic_client.messages.create.call_args
-        self.assertEqual(call_args.kwargs["tools"], mock_tools)
-        self.assertEqual(call_args.kwargs["tool_choice"], {"type": "auto"})
+API_KEY = "test_api_key"
+MODEL = "claude-sonnet-4-20250514"
 
-        self.assertEqual(result, "Direct answer without using tools")
+# Tool definitions shared read-only by the tool-use tests
+_MOCK_TOOLS = [
+    {
+        "name": "search_course_content",
+        "description": "Search course materials",
+        "input_schema": {
+            "type": "object",
+            "properties": {"query": {"type": "string"}},
+            "required": ["query"],
+        },
+    }
+]
 
-    def test_generate_response_with_tool_execution(self):
-        """Test response generation with tool execution"""
-        # Setup mock tools and tool manager
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search course materials",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            }
-        ]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = (
-            "[Python Basics - Lesson 1]\nPython is a programming language"
+@pytest.fixture(scope="module")
+def shared_generator():
+    """Mock Anthropic client and the generator using it, built once per module"""
+    client = AsyncMock()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            ai_generator.anthropic, "AsyncAnthropic", lambda *args, **kwargs: client
         )
+        yield client, AIGenerator(API_KEY, MODEL)
 
-        # Mock initial response with tool use
-        initial_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "What is Python"},
-                    "id": "tool_call_123",
-                }
-            ],
-        )
 
-        # Mock final response after tool execution
-        final_response = MockAnthropicResponse(
-            "Based on the search results, Python is a programming language used for various applications."
-        )
+@pytest.fixture
+async def anthropic_client(shared_generator):
+    """The shared mock client with calls and canned responses of earlier tests reset"""
+    client, _ = shared_generator
+    client.reset_mock(return_value=True, side_effect=True)
+    yield client
+    # Drop pooled clients so generators built in a test start fresh
+    await AIGenerator.close_all()
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            initial_response,
-            final_response,
-        ]
 
-        result = self.ai_generator.generate_response(
-            "What is Python?", tools=mock_tools, tool_manager=mock_tool_manager
-        )
+@pytest.fixture
+def generator(shared_generator, anthropic_client):
+    """AIGenerator wired to the mock Anthropic client"""
+    return shared_generator[1]
 
-        # Verify tool was executed
-        mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_course_content", query="What is Python"
-        )
 
-        # Verify two API calls were made
-        self.assertEqual(self.mock_anthropic_client.messages.create.call_count, 2)
+def last_kwargs(client):
+    """Keyword arguments of the most recent messages.create call"""
+    return client.messages.create.call_args.kwargs
 
-        # Check final result
-        self.assertEqual(
-            result,
-            "Based on the search results, Python is a programming language used for various applications.",
-        )
 
-    def test_conversation_history_included(self):
-        """Test that conversation history is included in system prompt"""
-        mock_response = MockAnthropicResponse("Response with history context")
-        self.mock_anthropic_client.messages.create.return_value = mock_response
+async def test_generate_response_without_tools(generator, anthropic_client):
+    """Test response generation without tools"""
+    # Mock API response
+    mock_response = MockAnthropicResponse("This is a direct response without tools")
+    anthropic_client.messages.create.return_value = mock_response
 
-        history = "User: Previous question\nAssistant: Previous answer"
+    result = await generator.generate_response("What is Python?")
 
-        self.ai_generator.generate_response(
-            "New question", conversation_history=history
-        )
+    # Verify API was called correctly
+    anthropic_client.messages.create.assert_called_once()
+    kwargs = last_kwargs(anthropic_client)
 
-        # Check that history was included in system prompt
-        call_args = self.mock_anthropic_client.messages.create.call_args
-        system_content = call_args.kwargs["system"]
-        self.assertIn("Previous conversation:", system_content)
-        self.assertIn("Previous question", system_content)
-        self.assertIn("Previous answer", system_content)
+    # Check basic parameters
+    assert kwargs["model"] == MODEL
+    assert kwargs["temperature"] == 0
+    assert kwargs["max_tokens"] == 800
 
-    def test_multiple_tool_calls_single_round(self):
-        """Test handling of multiple tool calls in single round"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search course materials",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            }
-        ]
+    # Check message content
+    messages = kwargs["messages"]
+    assert len(messages) == 1
+    assert messages[0]["role"] == "user"
+    assert messages[0]["content"] == "What is Python?"
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Search result 1",
-            "Search result 2",
-        ]
+    # Check system prompt
+    assert "course materials" in kwargs["system"][0]["text"]
 
-        # Mock response with multiple tool calls
-        initial_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "topic 1"},
-                    "id": "call_1",
-                },
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "topic 2"},
-                    "id": "call_2",
-                },
-            ],
-        )
+    assert result == "This is a direct response without tools"
 
-        final_response = MockAnthropicResponse(
-            "Combined response from multiple searches"
-        )
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            initial_response,
-            final_response,
-        ]
+async def test_generate_response_with_tools_no_tool_use(generator, anthropic_client):
+    """Test response with tools available but not used"""
+    mock_response = MockAnthropicResponse("Direct answer without using tools")
+    anthropic_client.messages.create.return_value = mock_response
 
-        result = self.ai_generator.generate_response(
-            "Compare topics", tools=mock_tools, tool_manager=mock_tool_manager
-        )
+    result = await generator.generate_response("What is 2+2?", tools=_MOCK_TOOLS)
 
-        # Verify both tools were executed
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
-        expected_calls = [
-            call("search_course_content", query="topic 1"),
-            call("search_course_content", query="topic 2"),
-        ]
-        mock_tool_manager.execute_tool.assert_has_calls(expected_calls)
+    # Verify tools were provided in API call
+    kwargs = last_kwargs(anthropic_client)
+    assert kwargs["tools"][0]["name"] == "search_course_content"
+    assert kwargs["tool_choice"] == {"type": "auto"}
 
-    def test_sequential_tool_calls_two_rounds(self):
-        """Test sequential tool calling across two rounds"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search course materials",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                    "required": ["query"],
-                },
-            }
-        ]
+    assert result == "Direct answer without using tools"
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "First search result about Python basics",
-            "Second search result about advanced Python",
-        ]
 
-        # Round 1: Initial tool call
-        round1_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "Python basics"},
-                    "id": "call_1",
-                }
-            ],
-        )
+async def test_generate_response_with_tool_execution(generator, anthropic_client):
+    """Test response generation with tool execution"""
+    # Setup mock tools and tool manager
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = (
+        "[Python Basics - Lesson 1]\nPython is a programming language",
+        [{"text": "Python Basics - Lesson 1", "link": None}],
+    )
 
-        # Round 2: Follow-up tool call
-        round2_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "advanced Python"},
-                    "id": "call_2",
-                }
-            ],
-        )
+    # Mock initial response with tool use
+    initial_response = search_tool_response("What is Python", "tool_call_123")
 
-        # Final response after 2 rounds
-        final_response = MockAnthropicResponse(
-            "Based on both searches, here's a comprehensive comparison of Python topics"
-        )
+    # Mock final response after tool execution
+    final_response = MockAnthropicResponse(
+        "Based on the search results, Python is a programming language used for various applications."
+    )
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            final_response,
-        ]
+    anthropic_client.messages.create.side_effect = [
+        initial_response,
+        final_response,
+    ]
 
-        result = self.ai_generator.generate_response(
-            "Compare Python basics with advanced topics",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager,
-        )
+    sources = []
+    result = await generator.generate_response(
+        "What is Python?",
+        tools=_MOCK_TOOLS,
+        tool_manager=mock_tool_manager,
+        sources=sources,
+    )
 
-        # Verify we made 3 API calls total (initial + round2 + final)
-        self.assertEqual(self.mock_anthropic_client.messages.create.call_count, 3)
+    # Verify tool was executed and its sources handed back
+    mock_tool_manager.execute_tool_with_sources.assert_called_once_with(
+        "search_course_content", query="What is Python"
+    )
+    assert sources == [{"text": "Python Basics - Lesson 1", "link": None}]
+
+    # Verify two API calls were made
+    assert anthropic_client.messages.create.call_count == 2
 
-        # Verify both tools were executed sequentially
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
-        expected_calls = [
-            call("search_course_content", query="Python basics"),
-            call("search_course_content", query="advanced Python"),
-        ]
-        mock_tool_manager.execute_tool.assert_has_calls(expected_calls)
+    # Check final result
+    assert (
+        result
+        == "Based on the search results, Python is a programming language used for various applications."
+    )
+
+
+async def test_conversation_history_included(generator, anthropic_client):
+    """Test that conversation history is included in system prompt"""
+    mock_response = MockAnthropicResponse("Response with history context")
+    anthropic_client.messages.create.return_value = mock_response
+
+    history = "User: Previous question\nAssistant: Previous answer"
 
-        # Verify final response
-        self.assertIn("comprehensive comparison", result)
+    await generator.generate_response("New question", conversation_history=history)
 
-    def test_sequential_tool_calls_max_rounds_limit(self):
-        """Test that sequential tool calling stops at max rounds limit"""
-        mock_tools = [
+    # Check that history was included in system prompt
+    kwargs = last_kwargs(anthropic_client)
+    system_blocks = kwargs["system"]
+    assert len(system_blocks) == 2
+    system_content = system_blocks[1]["text"]
+    assert "Previous conversation:" in system_content
+    assert "Previous question" in system_content
+    assert "Previous answer" in system_content
+
+
+async def test_long_conversation_history_is_bounded(anthropic_client):
+    """Test that oversized history is trimmed to its most recent turns"""
+    mock_response = MockAnthropicResponse("Response with history context")
+    anthropic_client.messages.create.return_value = mock_response
+    generator = AIGenerator(API_KEY, MODEL, max_history_tokens=10)
+
+    history = "User: Old question\nAssistant: Old answer\nUser: Latest question"
+
+    await generator.generate_response("New question", conversation_history=history)
+
+    kwargs = last_kwargs(anthropic_client)
+    history_block = kwargs["system"][1]["text"]
+    assert "[Earlier conversation omitted]" in history_block
+    assert "User: Latest question" in history_block
+    assert "Old question" not in history_block
+
+
+async def test_multiple_tool_calls_single_round(generator, anthropic_client):
+    """Test handling of multiple tool calls in single round"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.side_effect = lambda name, query: (
+        f"Search result for {query}",
+        [],
+    )
+
+    # Mock response with multiple tool calls
+    initial_response = MockAnthropicResponse(
+        content=[],
+        stop_reason="tool_use",
+        tool_calls=[
             {
                 "name": "search_course_content",
-                "description": "Search",
-                "input_schema": {},
-            }
-        ]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["Result 1", "Result 2"]
-
-        # Both rounds return tool_use responses
-        round1_response = MockAnthropicResponse(
+                "input": {"query": "topic 1"},
+                "id": "call_1",
+            },
+            {
+                "name": "search_course_content",
+                "input": {"query": "topic 2"},
+                "id": "call_2",
+            },
+        ],
+    )
+
+    final_response = MockAnthropicResponse("Combined response from multiple searches")
+
+    anthropic_client.messages.create.side_effect = [
+        initial_response,
+        final_response,
+    ]
+
+    result = await generator.generate_response(
+        "Compare topics", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
+
+    # Verify both tools were executed (concurrently, so in any order)
+    assert mock_tool_manager.execute_tool_with_sources.call_count == 2
+    expected_calls = [
+        call("search_course_content", query="topic 1"),
+        call("search_course_content", query="topic 2"),
+    ]
+    mock_tool_manager.execute_tool_with_sources.assert_has_calls(
+        expected_calls, any_order=True
+    )
+
+    # Tool results keep the order of the tool_use blocks
+    tool_results = anthropic_client.messages.create.call_args_list[1].kwargs[
+        "messages"
+    ][2]["content"]
+    assert [(r["tool_use_id"], r["content"]) for r in tool_results] == [
+        ("call_1", "Search result for topic 1"),
+        ("call_2", "Search result for topic 2"),
+    ]
+
+
+async def test_concurrent_tool_sources_follow_block_order(generator, anthropic_client):
+    """Test that sources keep tool_use order even when the first call is slowest"""
+
+    def execute_tool_with_sources(name, query):
+        if query == "topic 1":
+            time.sleep(0.05)
+        return f"Search result for {query}", [{"text": query, "link": None}]
+
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.side_effect = execute_tool_with_sources
+
+    anthropic_client.messages.create.side_effect = [
+        MockAnthropicResponse(
             content=[],
             stop_reason="tool_use",
             tool_calls=[
                 {
                     "name": "search_course_content",
-                    "input": {"query": "query1"},
+                    "input": {"query": "topic 1"},
                     "id": "call_1",
-                }
-            ],
-        )
-        round2_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
+                },
                 {
                     "name": "search_course_content",
-                    "input": {"query": "query2"},
+                    "input": {"query": "topic 2"},
                     "id": "call_2",
-                }
+                },
             ],
+        ),
+        MockAnthropicResponse("Combined response"),
+    ]
+
+    sources = []
+    await generator.generate_response(
+        "Compare topics",
+        tools=_MOCK_TOOLS,
+        tool_manager=mock_tool_manager,
+        sources=sources,
+    )
+
+    assert [source["text"] for source in sources] == ["topic 1", "topic 2"]
+
+
+async def test_sequential_tool_calls_two_rounds(generator, anthropic_client):
+    """Test sequential tool calling across two rounds"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.side_effect = [
+        ("First search result about Python basics", []),
+        ("Second search result about advanced Python", []),
+    ]
+
+    # Round 1: Initial tool call
+    round1_response = search_tool_response("Python basics", "call_1")
+
+    # Round 2: Follow-up tool call
+    round2_response = search_tool_response("advanced Python", "call_2")
+
+    # Final response after 2 rounds
+    final_response = MockAnthropicResponse(
+        "Based on both searches, here's a comprehensive comparison of Python topics"
+    )
+
+    anthropic_client.messages.create.side_effect = [
+        round1_response,
+        round2_response,
+        final_response,
+    ]
+
+    result = await generator.generate_response(
+        "Compare Python basics with advanced topics",
+        tools=_MOCK_TOOLS,
+        tool_manager=mock_tool_manager,
+    )
+
+    # Verify we made 3 API calls total (initial + round2 + final)
+    assert anthropic_client.messages.create.call_count == 3
+
+    # Verify both tools were executed sequentially
+    assert mock_tool_manager.execute_tool_with_sources.call_count == 2
+    expected_calls = [
+        call("search_course_content", query="Python basics"),
+        call("search_course_content", query="advanced Python"),
+    ]
+    mock_tool_manager.execute_tool_with_sources.assert_has_calls(expected_calls)
+
+    # Verify final response
+    assert "comprehensive comparison" in result
+
+
+async def test_sequential_tool_calls_max_rounds_limit(generator, anthropic_client):
+    """Test that sequential tool calling stops at max rounds limit"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.side_effect = [
+        ("Result 1", []),
+        ("Result 2", []),
+    ]
+
+    # Both rounds return tool_use responses
+    round1_response = search_tool_response("query1", "call_1")
+    round2_response = search_tool_response("query2", "call_2")
+    final_response = MockAnthropicResponse("Final synthesized response")
+
+    anthropic_client.messages.create.side_effect = [
+        round1_response,
+        round2_response,
+        final_response,
+    ]
+
+    result = await generator.generate_response(
+        "Complex query requiring multiple steps",
+        tools=_MOCK_TOOLS,
+        tool_manager=mock_tool_manager,
+    )
+
+    # Should execute exactly 2 rounds (max_rounds=2) then stop
+    assert mock_tool_manager.execute_tool_with_sources.call_count == 2
+    # Should make 3 API calls: round1, round2, final
+    assert anthropic_client.messages.create.call_count == 3
+
+    # Final call keeps the cached tool schemas but forbids further tool use
+    kwargs = last_kwargs(anthropic_client)
+    assert kwargs["tool_choice"] == {"type": "none"}
+    assert kwargs["tools"][0]["name"] == "search_course_content"
+
+    assert result == "Final synthesized response"
+
+
+async def test_tool_use_stop_without_tool_blocks(generator, anthropic_client):
+    """Test that a tool_use stop with no tool_use blocks skips to the final call"""
+    mock_tool_manager = Mock()
+
+    malformed_response = MockAnthropicResponse(
+        "Let me search for that.", stop_reason="tool_use"
+    )
+    anthropic_client.messages.create.side_effect = [
+        malformed_response,
+        MockAnthropicResponse("Final response"),
+    ]
+
+    result = await generator.generate_response(
+        "Query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
+
+    mock_tool_manager.execute_tool_with_sources.assert_not_called()
+    assert anthropic_client.messages.create.call_count == 2
+    kwargs = last_kwargs(anthropic_client)
+    assert kwargs["tool_choice"] == {"type": "none"}
+    assert len(kwargs["messages"]) == 1
+    assert result == "Final response"
+
+
+async def test_repeated_tool_call_reuses_result(generator, anthropic_client):
+    """Test that an identical tool call in a later round is not re-executed"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = (
+        "Python search result",
+        [],
+    )
+
+    def tool_round(call_id):
+        return search_tool_response("Python", call_id, course_name="MCP")
+
+    anthropic_client.messages.create.side_effect = [
+        tool_round("call_1"),
+        tool_round("call_2"),
+        MockAnthropicResponse("Final response"),
+    ]
+
+    result = await generator.generate_response(
+        "Query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
+
+    mock_tool_manager.execute_tool_with_sources.assert_called_once_with(
+        "search_course_content", query="Python", course_name="MCP"
+    )
+    messages = last_kwargs(anthropic_client)["messages"]
+    assert messages[4]["content"][0]["tool_use_id"] == "call_2"
+    assert messages[4]["content"][0]["content"] == "Python search result"
+    assert result == "Final response"
+
+
+async def test_cached_tool_result_reports_its_sources(generator):
+    """Test that a call served from the result cache still yields its sources"""
+    source = {"text": "MCP - Lesson 1", "link": None}
+    block = ToolBlock(
+        type="tool_use",
+        name="search_course_content",
+        input={"query": "Python"},
+        id="call_2",
+    )
+    result_cache = {
+        ("search_course_content", b'{"query":"Python"}'): (
+            "Python search result",
+            [source],
         )
-        final_response = MockAnthropicResponse("Final synthesized response")
+    }
+    mock_tool_manager = Mock()
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            final_response,
-        ]
+    sources = []
+    tool_results = await generator._execute_tools(
+        [block, block], mock_tool_manager, result_cache, sources
+    )
 
-        result = self.ai_generator.generate_response(
-            "Complex query requiring multiple steps",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager,
-        )
+    mock_tool_manager.execute_tool_with_sources.assert_not_called()
+    assert [r["content"] for r in tool_results] == ["Python search result"] * 2
+    assert sources == [source]
 
-        # Should execute exactly 2 rounds (max_rounds=2) then stop
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
-        # Should make 3 API calls: round1, round2, final
-        self.assertEqual(self.mock_anthropic_client.messages.create.call_count, 3)
 
-        self.assertEqual(result, "Final synthesized response")
+async def test_sequential_tool_calls_early_termination(generator, anthropic_client):
+    """Test that sequential tool calling stops when Claude doesn't use tools"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = ("Search result", [])
 
-    def test_sequential_tool_calls_early_termination(self):
-        """Test that sequential tool calling stops when Claude doesn't use tools"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search",
-                "input_schema": {},
-            }
-        ]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search result"
+    # Round 1: Uses tool
+    round1_response = search_tool_response("query", "call_1")
 
-        # Round 1: Uses tool
-        round1_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "query"},
-                    "id": "call_1",
-                }
-            ],
-        )
+    # Round 2: Doesn't use tools (stop_reason="end_turn")
+    round2_response = MockAnthropicResponse(
+        "Direct answer without more tools", stop_reason="end_turn"
+    )
 
-        # Round 2: Doesn't use tools (stop_reason="end_turn")
-        round2_response = MockAnthropicResponse(
-            "Direct answer without more tools", stop_reason="end_turn"
-        )
+    anthropic_client.messages.create.side_effect = [
+        round1_response,
+        round2_response,
+    ]
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-        ]
+    result = await generator.generate_response(
+        "Simple query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
 
-        result = self.ai_generator.generate_response(
-            "Simple query", tools=mock_tools, tool_manager=mock_tool_manager
-        )
+    # Should execute only 1 tool call, then stop when Claude doesn't use tools in round 2
+    assert mock_tool_manager.execute_tool_with_sources.call_count == 1
+    # Should make only 2 API calls: round1, round2 (no final call needed)
+    assert anthropic_client.messages.create.call_count == 2
 
-        # Should execute only 1 tool call, then stop when Claude doesn't use tools in round 2
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 1)
-        # Should make only 2 API calls: round1, round2 (no final call needed)
-        self.assertEqual(self.mock_anthropic_client.messages.create.call_count, 2)
+    assert result == "Direct answer without more tools"
 
-        self.assertEqual(result, "Direct answer without more tools")
 
-    def test_sequential_tool_calls_error_handling(self):
-        """Test error handling in sequential tool calling"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search",
-                "input_schema": {},
-            }
-        ]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search result"
+async def test_sequential_tool_calls_error_handling(
+    generator, anthropic_client, caplog
+):
+    """Test error handling in sequential tool calling"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = ("Search result", [])
 
-        # Round 1: Successful
-        round1_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "query"},
-                    "id": "call_1",
-                }
-            ],
-        )
+    # Round 1: Successful
+    round1_response = search_tool_response("query", "call_1")
 
-        # Mock final response to also fail
-        final_response = MockAnthropicResponse("Fallback response after error")
+    # Mock final response to also fail
+    final_response = MockAnthropicResponse("Fallback response after error")
 
-        # Round 2: API call fails, but final response succeeds
-        self.mock_anthropic_client.messages.create.side_effect = [
-            round1_response,
-            Exception("API error in round 2"),
-            final_response,
-        ]
+    # Round 2: API call fails, but final response succeeds
+    anthropic_client.messages.create.side_effect = [
+        round1_response,
+        Exception("API error in round 2"),
+        final_response,
+    ]
 
-        with patch("builtins.print") as mock_print:
-            result = self.ai_generator.generate_response(
-                "Query that causes error",
-                tools=mock_tools,
-                tool_manager=mock_tool_manager,
-            )
-
-        # Should execute first tool call successfully
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 1)
-
-        # Should print error message (check for either error type)
-        mock_print.assert_called()
-        error_message = mock_print.call_args[0][0]
-        self.assertTrue(
-            "Error in tool execution round" in error_message
-            or "Error in final response generation" in error_message
+    with caplog.at_level(logging.ERROR, logger="ai_generator"):
+        result = await generator.generate_response(
+            "Query that causes error",
+            tools=_MOCK_TOOLS,
+            tool_manager=mock_tool_manager,
         )
 
-        # Should still provide a response
-        self.assertIsNotNone(result)
+    # Should execute first tool call successfully
+    assert mock_tool_manager.execute_tool_with_sources.call_count == 1
 
-    def test_tool_execution_error_handling(self):
-        """Test handling of tool execution errors"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search",
-                "input_schema": {},
-            }
-        ]
+    # Should log the failed round and answer from the final call
+    assert "Error in tool execution round" in caplog.records[-1].getMessage()
+    assert result == "Fallback response after error"
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = (
-            "Tool execution failed: Database error"
-        )
 
-        initial_response = MockAnthropicResponse(
-            content=[],
-            stop_reason="tool_use",
-            tool_calls=[
-                {
-                    "name": "search_course_content",
-                    "input": {"query": "test"},
-                    "id": "call_1",
-                }
-            ],
-        )
+async def test_final_response_error_propagates(generator, anthropic_client):
+    """Test that a failed final call raises instead of returning an apology"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = ("Search result", [])
+
+    anthropic_client.messages.create.side_effect = [
+        search_tool_response("query1", "call_1"),
+        search_tool_response("query2", "call_2"),
+        Exception("API error in final call"),
+    ]
 
-        final_response = MockAnthropicResponse(
-            "I apologize, there was an error searching the content."
+    with pytest.raises(Exception, match="API error in final call"):
+        await generator.generate_response(
+            "Query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
         )
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            initial_response,
-            final_response,
-        ]
 
-        result = self.ai_generator.generate_response(
-            "Search question", tools=mock_tools, tool_manager=mock_tool_manager
-        )
+async def test_tool_execution_error_handling(generator, anthropic_client):
+    """Test handling of tool execution errors"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = (
+        "Tool execution failed: Database error",
+        [],
+    )
 
-        # Should handle error gracefully and return final response
-        self.assertEqual(
-            result, "I apologize, there was an error searching the content."
-        )
+    initial_response = search_tool_response("test", "call_1")
 
-    def test_system_prompt_structure(self):
-        """Test that system prompt contains expected instructions"""
-        mock_response = MockAnthropicResponse("Test response")
-        self.mock_anthropic_client.messages.create.return_value = mock_response
+    final_response = MockAnthropicResponse(
+        "I apologize, there was an error searching the content."
+    )
 
-        self.ai_generator.generate_response("Test query")
+    anthropic_client.messages.create.side_effect = [
+        initial_response,
+        final_response,
+    ]
 
-        call_args = self.mock_anthropic_client.messages.create.call_args
-        system_prompt = call_args.kwargs["system"]
+    result = await generator.generate_response(
+        "Search question", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
 
-        # Check key elements of system prompt
-        self.assertIn("course materials", system_prompt)
-        self.assertIn("Content Search Tool", system_prompt)
-        self.assertIn("Course Outline Tool", system_prompt)
-        self.assertIn("Brief, Concise and focused", system_prompt)
-        self.assertIn("Educational", system_prompt)
+    # Should handle error gracefully and return final response
+    assert result == "I apologize, there was an error searching the content."
 
-    def test_api_parameters(self):
-        """Test that API parameters are set correctly"""
-        mock_response = MockAnthropicResponse("Test response")
-        self.mock_anthropic_client.messages.create.return_value = mock_response
 
-        self.ai_generator.generate_response("Test query")
+async def test_system_prompt_structure(generator, anthropic_client):
+    """Test that system prompt contains expected instructions"""
+    mock_response = MockAnthropicResponse("Test response")
+    anthropic_client.messages.create.return_value = mock_response
 
-        call_args = self.mock_anthropic_client.messages.create.call_args
+    await generator.generate_response("Test query")
 
-        # Check that base parameters are applied
-        self.assertEqual(call_args.kwargs["model"], "claude-sonnet-4-20250514")
-        self.assertEqual(call_args.kwargs["temperature"], 0)
-        self.assertEqual(call_args.kwargs["max_tokens"], 800)
+    kwargs = last_kwargs(anthropic_client)
+    system_prompt = kwargs["system"][0]["text"]
 
-    def test_tool_call_message_flow(self):
-        """Test the message flow during tool execution"""
-        mock_tools = [
-            {
-                "name": "search_course_content",
-                "description": "Search",
-                "input_schema": {},
-            }
-        ]
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search results"
+    # Check key elements of system prompt
+    required = (
+        "course materials",
+        "Content Search Tool",
+        "Course Outline Tool",
+        "Brief, Concise and focused",
+        "Educational",
+    )
+    missing = [phrase for phrase in required if phrase not in system_prompt]
+    assert not missing, f"System prompt is missing: {missing}"
 
-        # Create mock tool content block
-        tool_content = Mock()
-        tool_content.type = "tool_use"
-        tool_content.name = "search_course_content"
-        tool_content.input = {"query": "test"}
-        tool_content.id = "call_123"
 
-        initial_response = Mock()
-        initial_response.content = [tool_content]
-        initial_response.stop_reason = "tool_use"
+async def test_prompt_caching_markers(generator, anthropic_client):
+    """Test that system prompt, history and tools are marked for caching"""
+    mock_tools = [
+        {"name": "search_course_content", "description": "Search"},
+        {"name": "get_course_outline", "description": "Outline"},
+    ]
+    mock_response = MockAnthropicResponse("Test response")
+    anthropic_client.messages.create.return_value = mock_response
 
-        final_response = MockAnthropicResponse("Final response")
+    await generator.generate_response(
+        "Test query",
+        conversation_history="User: Hi\nAssistant: Hello",
+        tools=mock_tools,
+    )
 
-        self.mock_anthropic_client.messages.create.side_effect = [
-            initial_response,
-            final_response,
-        ]
+    kwargs = last_kwargs(anthropic_client)
 
-        result = self.ai_generator.generate_response(
-            "Test query", tools=mock_tools, tool_manager=mock_tool_manager
-        )
+    # Static prompt and history are separate cacheable blocks
+    for block in kwargs["system"]:
+        assert block["cache_control"] == {"type": "ephemeral"}
+
+    # Only the last tool carries the cache breakpoint
+    tools = kwargs["tools"]
+    assert "cache_control" not in tools[0]
+    assert tools[1]["cache_control"] == {"type": "ephemeral"}
+
+    # Caller's tool definitions are left untouched
+    assert "cache_control" not in mock_tools[1]
 
-        # Check that second API call has proper message structure
-        second_call_args = self.mock_anthropic_client.messages.create.call_args_list[1]
-        messages = second_call_args.kwargs["messages"]
 
-        # Should have: user message, assistant message with tool use, user message with tool results
-        self.assertEqual(len(messages), 3)
-        self.assertEqual(messages[0]["role"], "user")  # Original query
-        self.assertEqual(messages[1]["role"], "assistant")  # Tool use response
-        self.assertEqual(messages[2]["role"], "user")  # Tool results
+def test_client_shared_across_instances(generator):
+    """Test that generators with the same API key reuse one client"""
+    other_generator = AIGenerator(API_KEY, "another-model")
+    assert other_generator.client is generator.client
 
-        # Check tool results format
-        tool_results = messages[2]["content"]
-        self.assertEqual(len(tool_results), 1)
-        self.assertEqual(tool_results[0]["type"], "tool_result")
-        self.assertEqual(tool_results[0]["tool_use_id"], "call_123")
-        self.assertEqual(tool_results[0]["content"], "Search results")
 
+async def test_api_parameters(generator, anthropic_client):
+    """Test that API parameters are set correctly"""
+    mock_response = MockAnthropicResponse("Test response")
+    anthropic_client.messages.create.return_value = mock_response
 
-if __name__ == "__main__":
-    unittest.main()
+    await generator.generate_response("Test query")
+
+    kwargs = last_kwargs(anthropic_client)
+
+    # Check that base parameters are applied
+    assert kwargs["model"] == "claude-sonnet-4-20250514"
+    assert kwargs["temperature"] == 0
+    assert kwargs["max_tokens"] == 800
+
+
+async def test_tool_call_message_flow(generator, anthropic_client):
+    """Test the message flow during tool execution"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = ("Search results", [])
+
+    # Create tool content block
+    tool_content = ToolBlock(
+        type="tool_use",
+        name="search_course_content",
+        input={"query": "test"},
+        id="call_123",
+    )
+    initial_response = MockResponse(content=[tool_content], stop_reason="tool_use")
+
+    final_response = MockAnthropicResponse("Final response")
+
+    anthropic_client.messages.create.side_effect = [
+        initial_response,
+        final_response,
+    ]
+
+    result = await generator.generate_response(
+        "Test query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+    )
+
+    # Check that second API call has proper message structure
+    second_call_args = anthropic_client.messages.create.call_args_list[1]
+    messages = second_call_args.kwargs["messages"]
+
+    # Should have: user message, assistant message with tool use, user message with tool results
+    assert len(messages) == 3
+    assert messages[0]["role"] == "user"  # Original query
+    assert messages[1]["role"] == "assistant"  # Tool use response
+    assert messages[2]["role"] == "user"  # Tool results
+
+    # Check tool results format
+    tool_results = messages[2]["content"]
+    assert len(tool_results) == 1
+    assert tool_results[0]["type"] == "tool_result"
+    assert tool_results[0]["tool_use_id"] == "call_123"
+    assert tool_results[0]["content"] == "Search results"
+
+
+async def test_stream_response_yields_chunks(generator, anthropic_client):
+    """Test that streamed text arrives chunk by chunk"""
+    anthropic_client.messages.stream = Mock(
+        return_value=MockAnthropicStream(
+            ["Python is ", "a language."],
+            MockAnthropicResponse("Python is a language."),
+        )
+    )
+
+    events = [event async for event in generator.stream_response("What is Python?")]
+
+    assert events == [
+        {"type": "text", "text": "Python is "},
+        {"type": "text", "text": "a language."},
+    ]
+    call_args = anthropic_client.messages.stream.call_args
+    assert call_args.kwargs["messages"][0]["content"] == "What is Python?"
+    anthropic_client.messages.create.assert_not_called()
+
+
+async def test_stream_response_with_tool_execution(generator, anthropic_client):
+    """Test that tools run between streamed rounds and preamble is discarded"""
+    mock_tool_manager = Mock()
+    mock_tool_manager.execute_tool_with_sources.return_value = ("Search results", [])
+
+    tool_round = search_tool_response("Python", "call_123")
+    anthropic_client.messages.stream = Mock(
+        side_effect=[
+            MockAnthropicStream(["Let me search. "], tool_round),
+            MockAnthropicStream(
+                ["Python is ", "a language."],
+                MockAnthropicResponse("Python is a language."),
+            ),
+        ]
+    )
+
+    events = [
+        event
+        async for event in generator.stream_response(
+            "What is Python?", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+        )
+    ]
+
+    assert events == [
+        {"type": "text", "text": "Let me search. "},
+        {"type": "discard"},
+        {"type": "text", "text": "Python is "},
+        {"type": "text", "text": "a language."},
+    ]
+    mock_tool_manager.execute_tool_with_sources.assert_called_once_with(
+        "search_course_content", query="Python"
+    )
+    assert anthropic_client.messages.stream.call_count == 2
+
+    messages = anthropic_client.messages.stream.call_args.kwargs["messages"]
+    assert messages[1]["role"] == "assistant"
+    assert messages[2]["content"][0]["tool_use_id"] == "call_123"
+    assert messages[2]["content"][0]["content"] == "Search results"
+
+
+async def test_stream_tool_use_stop_without_tool_blocks(generator, anthropic_client):
+    """Test that a streamed tool_use stop with no tool calls still gets an answer"""
+    mock_tool_manager = Mock()
+    anthropic_client.messages.stream = Mock(
+        side_effect=[
+            MockAnthropicStream(
+                ["Let me search for that."],
+                MockAnthropicResponse(
+                    "Let me search for that.", stop_reason="tool_use"
+                ),
+            ),
+            MockAnthropicStream(
+                ["Final response"], MockAnthropicResponse("Final response")
+            ),
+        ]
+    )
+
+    events = [
+        event
+        async for event in generator.stream_response(
+            "Query", tools=_MOCK_TOOLS, tool_manager=mock_tool_manager
+        )
+    ]
+
+    assert events == [
+        {"type": "text", "text": "Let me search for that."},
+        {"type": "discard"},
+        {"type": "text", "text": "Final response"},
+    ]
+    mock_tool_manager.execute_tool_with_sources.assert_not_called()
+    kwargs = anthropic_client.messages.stream.call_args.kwargs
+    assert kwargs["tool_choice"] == {"type": "none"}
+    assert len(kwargs["messages"]) == 1
@@ -4,20 +4,63 @@ API endpoint tests for the RAG system FastAPI application
 import pytest
 from unittest.mock import Mock, AsyncMock, patch
 from fastapi.testclient import TestClient
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import httpx
 
-# Import the app components but create a test version
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
 from app import QueryRequest, QueryResponse, CourseStats
-from rag_system import RAGSystem
 from config import config
 
+# Oversized query body, built once at import
+_LONG_QUERY = "What are the key concepts? " * 1000
+
+_SAMPLE_ANSWER = (
+    "The course covers introduction and advanced topics with practical examples.",
+    [{"course_title": "Test Course", "content": "This is the introduction lesson content"}],
+)
+
+
+# Mock RAG system shared by the test endpoints
+mock_rag_system = Mock()
+mock_rag_system.query = AsyncMock()
+mock_rag_system.session_manager = Mock()
+
+
+async def query_documents(request: QueryRequest):
+    """Test endpoint for query processing"""
+    try:
+        session_id = request.session_id
+        if not session_id:
+            session_id = mock_rag_system.session_manager.create_session()
+        
+        answer, sources = await mock_rag_system.query(request.query, session_id)
+        
+        return QueryResponse(
+            answer=answer,
+            sources=sources,
+            session_id=session_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_course_stats():
+    """Test endpoint for course statistics"""
+    try:
+        analytics = mock_rag_system.get_course_analytics()
+        return CourseStats(
+            total_courses=analytics["total_courses"],
+            course_titles=analytics["course_titles"]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def root():
+    """Test root endpoint"""
+    return {"message": "Course Materials RAG System API"}
+
 
 def create_test_app():
     """Create a test FastAPI app without static file mounting"""
@@ -38,46 +81,10 @@ def create_test_app():
         expose_headers=["*"],
     )
     
-    # Mock RAG system for testing
-    mock_rag_system = Mock(spec=RAGSystem)
-    mock_rag_system.session_manager = Mock()
-    
-    @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
-        """Test endpoint for query processing"""
-        try:
-            session_id = request.session_id
-            if not session_id:
-                session_id = mock_rag_system.session_manager.create_session()
-            
-            answer, sources = mock_rag_system.query(request.query, session_id)
-            
-            return QueryResponse(
-                answer=answer,
-                sources=sources,
-                session_id=session_id
-            )
-        except Exception as e:
-            from fastapi import HTTPException
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    @app.get("/api/courses", response_model=CourseStats)
-    async def get_course_stats():
-        """Test endpoint for course statistics"""
-        try:
-            analytics = mock_rag_system.get_course_analytics()
-            return CourseStats(
-                total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
-            )
-        except Exception as e:
-            from fastapi import HTTPException
-            raise HTTPException(status_code=500, detail=str(e))
-    
-    @app.get("/")
-    async def root():
-        """Test root endpoint"""
-        return {"message": "Course Materials RAG System API"}
+    # Handlers are module-level so handler tests can call them directly
+    app.post("/api/query", response_model=QueryResponse)(query_documents)
+    app.get("/api/courses", response_model=CourseStats)(get_course_stats)
+    app.get("/")(root)
     
     # Store mock for access in tests
     app.state.mock_rag_system = mock_rag_system
@@ -85,18 +92,25 @@ def create_test_app():
     return app
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_app():
-    """Test FastAPI application fixture"""
+    """Test FastAPI application fixture, built once per session"""
     return create_test_app()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def client(test_app):
     """Test client fixture"""
     return TestClient(test_app)
 
 
+@pytest.fixture
+def mock_rag():
+    """The endpoints' mock RAG system, reset for each test"""
+    mock_rag_system.reset_mock(return_value=True, side_effect=True)
+    return mock_rag_system
+
+
 @pytest.fixture
 def async_client(test_app):
     """Async test client fixture"""
@@ -115,53 +129,47 @@ class TestAPIEndpoints:
         assert response.json() == {"message": "Course Materials RAG System API"}
     
     @pytest.mark.api
-    def test_query_endpoint_success(self, client, test_app, sample_query_response):
-        """Test successful query endpoint"""
-        # Setup mock responses
-        mock_rag = test_app.state.mock_rag_system
-        mock_rag.session_manager.create_session.return_value = "test-session-id"
-        mock_rag.query.return_value = (
-            sample_query_response["answer"], 
-            sample_query_response["sources"]
-        )
-        
-        # Test request
-        request_data = {
-            "query": "What are the key concepts?",
-            "session_id": "test-session-id"
-        }
-        
-        response = client.post("/api/query", json=request_data)
-        
-        assert response.status_code == 200
-        response_data = response.json()
-        assert "answer" in response_data
-        assert "sources" in response_data  
-        assert "session_id" in response_data
-        assert response_data["session_id"] == "test-session-id"
-    
-    @pytest.mark.api  
-    def test_query_endpoint_no_session_id(self, client, test_app, sample_query_response):
-        """Test query endpoint creates session when none provided"""
-        # Setup mock responses
-        mock_rag = test_app.state.mock_rag_system
+    @pytest.mark.parametrize(
+        "query,session_id,rag_return,rag_side_effect,expected_status",
+        [
+            ("What are the key concepts?", "test-session-id", _SAMPLE_ANSWER, None, 200),
+            ("What are the key concepts?", None, _SAMPLE_ANSWER, None, 200),
+            ("", "test-session-id", ("I need more information to help you.", []), None, 200),
+            (_LONG_QUERY, "test-session-id", ("Here's a summary response", []), None, 200),
+            (
+                "What are the key concepts?",
+                "test-session-id",
+                None,
+                Exception("Database connection failed"),
+                500,
+            ),
+        ],
+        ids=["success", "no_session_id", "empty_query", "very_long_query", "server_error"],
+    )
+    async def test_query_endpoint(
+        self, mock_rag, query, session_id, rag_return, rag_side_effect, expected_status
+    ):
+        """Test query endpoint answers, creates missing sessions and reports errors"""
         mock_rag.session_manager.create_session.return_value = "new-session-id"
-        mock_rag.query.return_value = (
-            sample_query_response["answer"],
-            sample_query_response["sources"]
-        )
+        mock_rag.query.return_value = rag_return
+        mock_rag.query.side_effect = rag_side_effect
         
-        # Test request without session_id
-        request_data = {
-            "query": "What are the key concepts?"
-        }
+        request = QueryRequest(query=query, session_id=session_id)
         
-        response = client.post("/api/query", json=request_data)
+        if rag_side_effect:
+            with pytest.raises(HTTPException) as exc_info:
+                await query_documents(request)
+            assert exc_info.value.status_code == expected_status
+            assert str(rag_side_effect) in exc_info.value.detail
+            return
         
-        assert response.status_code == 200
-        response_data = response.json()
-        assert response_data["session_id"] == "new-session-id"
-        mock_rag.session_manager.create_session.assert_called_once()
+        response = await query_documents(request)
+        
+        assert response.answer == rag_return[0]
+        assert response.sources == rag_return[1]
+        assert response.session_id == (session_id or "new-session-id")
+        if session_id is None:
+            mock_rag.session_manager.create_session.assert_called_once()
     
     @pytest.mark.api
     def test_query_endpoint_invalid_request(self, client):
@@ -175,90 +183,29 @@ class TestAPIEndpoints:
         assert response.status_code == 422  # Unprocessable Entity
     
     @pytest.mark.api
-    def test_query_endpoint_server_error(self, client, test_app):
-        """Test query endpoint handles server errors"""
-        # Setup mock to raise exception
-        mock_rag = test_app.state.mock_rag_system
-        mock_rag.session_manager.create_session.return_value = "test-session-id"
-        mock_rag.query.side_effect = Exception("Database connection failed")
-        
-        request_data = {
-            "query": "What are the key concepts?",
-            "session_id": "test-session-id"
-        }
-        
-        response = client.post("/api/query", json=request_data)
-        assert response.status_code == 500
-        assert "Database connection failed" in response.json()["detail"]
-    
-    @pytest.mark.api
-    def test_courses_endpoint_success(self, client, test_app, sample_course_stats):
+    async def test_courses_endpoint_success(self, mock_rag, sample_course_stats):
         """Test successful courses endpoint"""
         # Setup mock response
-        mock_rag = test_app.state.mock_rag_system
         mock_rag.get_course_analytics.return_value = sample_course_stats
         
-        response = client.get("/api/courses")
+        response = await get_course_stats()
         
-        assert response.status_code == 200
-        response_data = response.json()
-        assert "total_courses" in response_data
-        assert "course_titles" in response_data
-        assert response_data["total_courses"] == 1
-        assert response_data["course_titles"] == ["Test Course"]
+        assert response.total_courses == 1
+        assert response.course_titles == ["Test Course"]
     
     @pytest.mark.api
-    def test_courses_endpoint_server_error(self, client, test_app):
+    async def test_courses_endpoint_server_error(self, mock_rag):
         """Test courses endpoint handles server errors"""
         # Setup mock to raise exception
-        mock_rag = test_app.state.mock_rag_system
         mock_rag.get_course_analytics.side_effect = Exception("Analytics service unavailable")
         
-        response = client.get("/api/courses")
-        assert response.status_code == 500
-        assert "Analytics service unavailable" in response.json()["detail"]
-    
-    @pytest.mark.api
-    def test_query_endpoint_empty_query(self, client, test_app):
-        """Test query endpoint with empty query string"""
-        mock_rag = test_app.state.mock_rag_system
-        mock_rag.session_manager.create_session.return_value = "test-session-id"
-        mock_rag.query.return_value = ("I need more information to help you.", [])
-        
-        request_data = {
-            "query": "",
-            "session_id": "test-session-id"
-        }
-        
-        response = client.post("/api/query", json=request_data)
-        assert response.status_code == 200
-        # Should still process empty queries
-        response_data = response.json()
-        assert "answer" in response_data
-    
-    @pytest.mark.api
-    def test_query_endpoint_very_long_query(self, client, test_app):
-        """Test query endpoint with very long query"""
-        mock_rag = test_app.state.mock_rag_system
-        mock_rag.session_manager.create_session.return_value = "test-session-id"
-        mock_rag.query.return_value = ("Here's a summary response", [])
-        
-        # Create a very long query
-        long_query = "What are the key concepts? " * 1000
-        
-        request_data = {
-            "query": long_query,
-            "session_id": "test-session-id"
-        }
-        
-        response = client.post("/api/query", json=request_data)
-        assert response.status_code == 200
-        # Should handle long queries gracefully
-
+        with pytest.raises(HTTPException) as exc_info:
+            await get_course_stats()
+        assert exc_info.value.status_code == 500
+        assert "Analytics service unavailable" in exc_info.value.detail
 
-# Note: Async endpoint testing can be complex with FastAPI TestClient
-# The TestClient already handles async endpoints properly, so separate async testing 
-# is not strictly necessary for this use case
+# Handler logic above is tested by awaiting the endpoints directly; the tests
+# below go through TestClient to cover request validation and JSON responses
 
 
 class TestAPIValidation:
@@ -276,9 +223,8 @@ class TestAPIValidation:
         assert response.status_code == 422
     
     @pytest.mark.api
-    def test_query_response_structure(self, client, test_app):
+    def test_query_response_structure(self, client, mock_rag):
         """Test QueryResponse structure matches expected format"""
-        mock_rag = test_app.state.mock_rag_system
         mock_rag.session_manager.create_session.return_value = "test-session-id"
         mock_rag.query.return_value = (
             "Test answer",
@@ -302,9 +248,8 @@ class TestAPIValidation:
         assert isinstance(data["session_id"], str)
     
     @pytest.mark.api  
-    def test_courses_response_structure(self, client, test_app):
+    def test_courses_response_structure(self, client, mock_rag):
         """Test CourseStats response structure"""
-        mock_rag = test_app.state.mock_rag_system
         mock_rag.get_course_analytics.return_value = {
             "total_courses": 2,
             "course_titles": ["Course 1", "Course 2"]
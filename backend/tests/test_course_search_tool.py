@@ -1,14 +1,34 @@
-import sys
-import os
 import unittest
+import pytest
 from unittest.mock import Mock, MagicMock, patch
 from typing import List, Dict, Any
 
-# Add the parent directory to sys.path to import modules
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from search_tools import CourseSearchTool
-from vector_store import SearchResults
+from vector_store import SearchResults, VectorStore
+
+# Spec'd mock store shared by every test and reset in setUp; spec_set fixes
+# the attribute set up front, so typos fail on both read and assignment
+_STORE_TEMPLATE = MagicMock(spec_set=VectorStore)
+
+
+def _mk_results(docs=(), meta=(), dist=None, err=None):
+    """
+    Build fresh SearchResults for the mocked store.
+
+    Args:
+        docs: Tuple of document strings
+        meta: Tuple of (course_title, lesson_number) pairs, one per document
+        dist: Optional tuple of distances, defaults to 0.1 per document
+        err: Optional error message
+    """
+    return SearchResults(
+        documents=list(docs),
+        metadata=[
+            {"course_title": title, "lesson_number": lesson} for title, lesson in meta
+        ],
+        distances=list(dist) if dist is not None else [0.1] * len(docs),
+        error=err,
+    )
 
 
 class TestCourseSearchTool(unittest.TestCase):
@@ -16,26 +36,21 @@ class TestCourseSearchTool(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures"""
-        # Create mock vector store
-        self.mock_vector_store = Mock()
+        # Reuse the shared mock vector store with a clean slate
+        _STORE_TEMPLATE.reset_mock(return_value=True, side_effect=True)
+        self.mock_vector_store = _STORE_TEMPLATE
         self.search_tool = CourseSearchTool(self.mock_vector_store)
 
     def test_successful_search_with_results(self):
         """Test successful search returning results"""
         # Mock search results
-        mock_results = SearchResults(
-            documents=[
+        self.mock_vector_store.search.return_value = _mk_results(
+            (
                 "This is course content about Python programming",
                 "More Python content",
-            ],
-            metadata=[
-                {"course_title": "Python Basics", "lesson_number": 1},
-                {"course_title": "Python Basics", "lesson_number": 2},
-            ],
-            distances=[0.1, 0.2],
-            error=None,
+            ),
+            (("Python Basics", 1), ("Python Basics", 2)),
         )
-        self.mock_vector_store.search.return_value = mock_results
         self.mock_vector_store.get_lesson_link.return_value = (
             "https://example.com/lesson1"
         )
@@ -54,140 +69,11 @@ class TestCourseSearchTool(unittest.TestCase):
         self.assertIn("This is course content about Python programming", result)
         self.assertIn("More Python content", result)
 
-    def test_search_with_course_filter(self):
-        """Test search with course name filter"""
-        mock_results = SearchResults(
-            documents=["Filtered content"],
-            metadata=[{"course_title": "Advanced Python", "lesson_number": 3}],
-            distances=[0.1],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = None
-
-        result = self.search_tool.execute("functions", course_name="Advanced Python")
-
-        self.mock_vector_store.search.assert_called_once_with(
-            query="functions", course_name="Advanced Python", lesson_number=None
-        )
-
-        self.assertIn("[Advanced Python - Lesson 3]", result)
-
-    def test_search_with_lesson_filter(self):
-        """Test search with lesson number filter"""
-        mock_results = SearchResults(
-            documents=["Lesson specific content"],
-            metadata=[{"course_title": "Data Science", "lesson_number": 5}],
-            distances=[0.1],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = (
-            "https://example.com/lesson5"
-        )
-
-        result = self.search_tool.execute("pandas", lesson_number=5)
-
-        self.mock_vector_store.search.assert_called_once_with(
-            query="pandas", course_name=None, lesson_number=5
-        )
-
-        self.assertIn("[Data Science - Lesson 5]", result)
-
-    def test_search_with_both_filters(self):
-        """Test search with both course name and lesson number"""
-        mock_results = SearchResults(
-            documents=["Very specific content"],
-            metadata=[{"course_title": "Machine Learning", "lesson_number": 2}],
-            distances=[0.1],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = (
-            "https://example.com/ml-lesson2"
-        )
-
-        result = self.search_tool.execute(
-            "neural networks", course_name="Machine Learning", lesson_number=2
-        )
-
-        self.mock_vector_store.search.assert_called_once_with(
-            query="neural networks", course_name="Machine Learning", lesson_number=2
-        )
-
-    def test_empty_search_results(self):
-        """Test handling of empty search results"""
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
-
-        result = self.search_tool.execute("nonexistent topic")
-
-        self.assertEqual(result, "No relevant content found.")
-
-    def test_empty_results_with_course_filter(self):
-        """Test empty results with course filter"""
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
-
-        result = self.search_tool.execute("topic", course_name="Nonexistent Course")
-
-        self.assertEqual(
-            result, "No relevant content found in course 'Nonexistent Course'."
-        )
-
-    def test_empty_results_with_lesson_filter(self):
-        """Test empty results with lesson filter"""
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
-
-        result = self.search_tool.execute("topic", lesson_number=99)
-
-        self.assertEqual(result, "No relevant content found in lesson 99.")
-
-    def test_empty_results_with_both_filters(self):
-        """Test empty results with both filters"""
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
-
-        result = self.search_tool.execute(
-            "topic", course_name="Test Course", lesson_number=1
-        )
-
-        self.assertEqual(
-            result, "No relevant content found in course 'Test Course' in lesson 1."
-        )
-
-    def test_search_error_handling(self):
-        """Test handling of search errors"""
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error="Database connection failed"
-        )
-        self.mock_vector_store.search.return_value = mock_results
-
-        result = self.search_tool.execute("any query")
-
-        self.assertEqual(result, "Database connection failed")
-
     def test_sources_tracking(self):
         """Test that sources are properly tracked"""
-        mock_results = SearchResults(
-            documents=["Content 1", "Content 2"],
-            metadata=[
-                {"course_title": "Course A", "lesson_number": 1},
-                {"course_title": "Course B", "lesson_number": None},
-            ],
-            distances=[0.1, 0.2],
-            error=None,
+        self.mock_vector_store.search.return_value = _mk_results(
+            ("Content 1", "Content 2"), (("Course A", 1), ("Course B", None))
         )
-        self.mock_vector_store.search.return_value = mock_results
         self.mock_vector_store.get_lesson_link.side_effect = ["https://link1.com", None]
 
         self.search_tool.execute("test query")
@@ -201,13 +87,9 @@ class TestCourseSearchTool(unittest.TestCase):
 
     def test_lesson_link_error_handling(self):
         """Test handling of lesson link retrieval errors"""
-        mock_results = SearchResults(
-            documents=["Content with link error"],
-            metadata=[{"course_title": "Test Course", "lesson_number": 1}],
-            distances=[0.1],
-            error=None,
+        self.mock_vector_store.search.return_value = _mk_results(
+            ("Content with link error",), (("Test Course", 1),)
         )
-        self.mock_vector_store.search.return_value = mock_results
         self.mock_vector_store.get_lesson_link.side_effect = Exception(
             "Link retrieval failed"
         )
@@ -239,6 +121,26 @@ class TestCourseSearchTool(unittest.TestCase):
         self.assertIn("[Overview Course]", result)
         self.assertNotIn("Lesson", result)
 
+    def test_repeated_query_reuses_embedding(self):
+        """Test a repeated search query is embedded only once"""
+        embedder = Mock(return_value=[[0.1, 0.2, 0.3]])
+        with patch("vector_store.chromadb.EphemeralClient"):
+            store = VectorStore(
+                None, "unused-model", embedding_function=embedder, in_memory=True
+            )
+        store.course_content.query.return_value = {
+            "documents": [["Python content"]],
+            "metadatas": [[{"course_title": "Python Basics"}]],
+            "distances": [[0.1]],
+        }
+        search_tool = CourseSearchTool(store)
+
+        first = search_tool.execute("Python programming")
+        second = search_tool.execute("Python programming")
+
+        self.assertEqual(first, second)
+        embedder.assert_called_once_with(["Python programming"])
+
     def test_tool_definition(self):
         """Test that tool definition is properly structured"""
         definition = self.search_tool.get_tool_definition()
@@ -260,5 +162,74 @@ class TestCourseSearchTool(unittest.TestCase):
         self.assertIn("lesson_number", properties)
 
 
+@pytest.fixture(scope="module")
+def search_tool():
+    """One CourseSearchTool over the shared mock store for the table tests"""
+    return CourseSearchTool(_STORE_TEMPLATE)
+
+
+@pytest.fixture
+def mock_store():
+    """The shared mock vector store, reset for each case"""
+    _STORE_TEMPLATE.reset_mock(return_value=True, side_effect=True)
+    return _STORE_TEMPLATE
+
+
+@pytest.mark.parametrize(
+    "filters, course_title, lesson_number",
+    [
+        ({"course_name": "Advanced Python"}, "Advanced Python", 3),
+        ({"lesson_number": 5}, "Data Science", 5),
+        (
+            {"course_name": "Machine Learning", "lesson_number": 2},
+            "Machine Learning",
+            2,
+        ),
+    ],
+    ids=["course", "lesson", "course_and_lesson"],
+)
+def test_search_filters(search_tool, mock_store, filters, course_title, lesson_number):
+    """Test filters are passed to the store and shown in result headers"""
+    mock_store.search.return_value = _mk_results(
+        ("Filtered content",), ((course_title, lesson_number),)
+    )
+    mock_store.get_lesson_link.return_value = None
+
+    result = search_tool.execute("query", **filters)
+
+    mock_store.search.assert_called_once_with(
+        query="query",
+        course_name=filters.get("course_name"),
+        lesson_number=filters.get("lesson_number"),
+    )
+    assert f"[{course_title} - Lesson {lesson_number}]" in result
+
+
+@pytest.mark.parametrize(
+    "filters, error, expected",
+    [
+        ({}, None, "No relevant content found."),
+        (
+            {"course_name": "Nonexistent Course"},
+            None,
+            "No relevant content found in course 'Nonexistent Course'.",
+        ),
+        ({"lesson_number": 99}, None, "No relevant content found in lesson 99."),
+        (
+            {"course_name": "Test Course", "lesson_number": 1},
+            None,
+            "No relevant content found in course 'Test Course' in lesson 1.",
+        ),
+        ({}, "Database connection failed", "Database connection failed"),
+    ],
+    ids=["no_filter", "course", "lesson", "course_and_lesson", "search_error"],
+)
+def test_empty_and_error_results(search_tool, mock_store, filters, error, expected):
+    """Test the message returned when a search finds nothing or fails"""
+    mock_store.search.return_value = _mk_results(err=error)
+
+    assert search_tool.execute("topic", **filters) == expected
+
+
 if __name__ == "__main__":
     unittest.main()
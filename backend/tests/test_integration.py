@@ -1,90 +1,153 @@
-import sys
 import os
+import re
+import zlib
 import unittest
 import tempfile
-import shutil
+import chromadb
+import numpy as np
+import pytest
 from pathlib import Path
-from unittest.mock import patch, Mock
-
-# Add the parent directory to sys.path to import modules
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from types import SimpleNamespace
+from unittest.mock import patch, Mock, AsyncMock
 
 from rag_system import RAGSystem
+from ai_generator import AIGenerator
 from vector_store import VectorStore, SearchResults
 from search_tools import CourseSearchTool, ToolManager
 from models import Course, Lesson, CourseChunk
 from config import Config
-
-
-class TestIntegration(unittest.TestCase):
+from chromadb.api.types import EmbeddingFunction
+from chromadb.config import Settings
+
+# Model for the test that embeds for real; small unless overridden
+TEST_EMBED_MODEL = os.environ.get("TEST_EMBED_MODEL", "paraphrase-MiniLM-L3-v2")
+
+# Canned end_turn reply, built once; plain namespaces are all the generator reads
+_ANTHROPIC_MOCK_RESPONSE = SimpleNamespace(
+    content=[
+        SimpleNamespace(
+            type="text",
+            text="Based on the course content, data structures are fundamental.",
+        )
+    ],
+    stop_reason="end_turn",
+)
+
+# Immutable course fixtures, built once and shared by reference
+_TEST_COURSE = Course(
+    title="Test Integration Course",
+    instructor="Test Instructor",
+    course_link="https://example.com/course",
+    lessons=[
+        Lesson(
+            lesson_number=1,
+            title="Introduction",
+            lesson_link="https://example.com/lesson1",
+        ),
+        Lesson(
+            lesson_number=2,
+            title="Advanced Topics",
+            lesson_link="https://example.com/lesson2",
+        ),
+    ],
+)
+
+_TEST_CHUNKS = (
+    CourseChunk(
+        content="This is an introduction to Python programming. Python is a powerful language.",
+        course_title="Test Integration Course",
+        lesson_number=1,
+        chunk_index=0,
+    ),
+    CourseChunk(
+        content="Advanced Python covers classes, decorators, and metaclasses in detail.",
+        course_title="Test Integration Course",
+        lesson_number=2,
+        chunk_index=1,
+    ),
+)
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Hashed bag-of-words embedder, so glue-code tests skip model inference"""
+
+    DIMENSIONS = 384
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input):
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.DIMENSIONS, dtype=np.float32)
+            for token in re.findall(r"\w+", text.lower()):
+                # crc32 rather than hash() so vectors are stable across runs
+                vector[zlib.crc32(token.encode()) % self.DIMENSIONS] += 1.0
+            norm = np.linalg.norm(vector)
+            embeddings.append(vector / norm if norm else vector)
+        return embeddings
+
+    @staticmethod
+    def name():
+        return "fake_hash_embedding"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return FakeEmbeddingFunction()
+
+
+@pytest.mark.integration
+class TestIntegration(unittest.IsolatedAsyncioTestCase):
     """Integration tests for the RAG system components working together"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create one in-memory vector store for the whole class"""
+        cls.embedding_function = FakeEmbeddingFunction()
+        cls.vector_store = VectorStore(
+            None,
+            "all-MiniLM-L6-v2",
+            max_results=3,
+            embedding_function=cls.embedding_function,
+            in_memory=True,
+            hnsw_ef=8,
+        )
+
     def setUp(self):
         """Set up test environment for each test"""
-        # Create unique temporary directory for each test
-        self.test_dir = tempfile.mkdtemp()
-        self.chroma_path = os.path.join(self.test_dir, "test_chroma")
-
         # Create a mock config for testing
         self.config = Mock()
         self.config.CHUNK_SIZE = 800
         self.config.CHUNK_OVERLAP = 100
-        self.config.CHROMA_PATH = self.chroma_path
-        self.config.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+        self.config.CHROMA_PATH = None
+        self.config.EMBEDDING_MODEL = TEST_EMBED_MODEL
         self.config.MAX_RESULTS = 5
         self.config.ANTHROPIC_API_KEY = "test_key"
         self.config.ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
         self.config.MAX_HISTORY = 2
+        self.config.MAX_HISTORY_TOKENS = 2000
+        self.config.ENABLE_RESPONSE_CACHE = False
 
     def tearDown(self):
-        """Clean up test environment after each test"""
-        if os.path.exists(self.test_dir):
-            shutil.rmtree(self.test_dir)
+        """Empty the shared collections so tests stay isolated"""
+        self.vector_store.clear_all_data()
+
+    async def asyncTearDown(self):
+        """Drop pooled clients so the next test gets a fresh mock"""
+        await AIGenerator.close_all()
 
     def test_vector_store_real_operations(self):
         """Test VectorStore with real ChromaDB operations"""
-        # Create real VectorStore instance
-        vector_store = VectorStore(self.chroma_path, "all-MiniLM-L6-v2", max_results=3)
+        vector_store = self.vector_store
 
         # Test adding course metadata
-        course = Course(
-            title="Test Integration Course",
-            instructor="Test Instructor",
-            course_link="https://example.com/course",
-            lessons=[
-                Lesson(
-                    lesson_number=1,
-                    title="Introduction",
-                    lesson_link="https://example.com/lesson1",
-                ),
-                Lesson(
-                    lesson_number=2,
-                    title="Advanced Topics",
-                    lesson_link="https://example.com/lesson2",
-                ),
-            ],
-        )
-
-        # Add course metadata
-        vector_store.add_course_metadata(course)
+        vector_store.add_course_metadata(_TEST_COURSE)
 
         # Test adding course content chunks
-        chunks = [
-            CourseChunk(
-                content="This is an introduction to Python programming. Python is a powerful language.",
-                course_title="Test Integration Course",
-                lesson_number=1,
-                chunk_index=0,
-            ),
-            CourseChunk(
-                content="Advanced Python covers classes, decorators, and metaclasses in detail.",
-                course_title="Test Integration Course",
-                lesson_number=2,
-                chunk_index=1,
-            ),
-        ]
-
-        vector_store.add_course_content(chunks)
+        vector_store.add_course_content(_TEST_CHUNKS)
 
         # Test search functionality
         results = vector_store.search("Python programming")
@@ -95,6 +158,12 @@ class TestIntegration(unittest.TestCase):
         self.assertGreater(len(results.documents), 0)
         self.assertIn("Python", results.documents[0])
 
+        # Inner-product space: distance is 1 - cosine for unit-length vectors
+        self.assertEqual(
+            vector_store.course_content.configuration["hnsw"]["space"], "ip"
+        )
+        self.assertTrue(np.all((results.distances >= -1e-5) & (results.distances < 1)))
+
         # Test course-specific search
         results = vector_store.search("Python", course_name="Test Integration Course")
         self.assertFalse(results.is_empty())
@@ -125,7 +194,7 @@ class TestIntegration(unittest.TestCase):
     def test_course_search_tool_real_operations(self):
         """Test CourseSearchTool with real VectorStore"""
         # Create real components
-        vector_store = VectorStore(self.chroma_path, "all-MiniLM-L6-v2", max_results=3)
+        vector_store = self.vector_store
         search_tool = CourseSearchTool(vector_store)
 
         # Add test data
@@ -173,7 +242,7 @@ class TestIntegration(unittest.TestCase):
     def test_tool_manager_real_integration(self):
         """Test ToolManager with real tools"""
         # Create real components
-        vector_store = VectorStore(self.chroma_path, "all-MiniLM-L6-v2", max_results=3)
+        vector_store = self.vector_store
         tool_manager = ToolManager()
         search_tool = CourseSearchTool(vector_store)
 
@@ -220,30 +289,36 @@ class TestIntegration(unittest.TestCase):
         # Test unknown tool
         error_result = tool_manager.execute_tool("unknown_tool", query="test")
         self.assertEqual(error_result, "Tool 'unknown_tool' not found")
+        self.assertEqual(
+            tool_manager.execute_tool_with_sources("unknown_tool", query="test"),
+            ("Tool 'unknown_tool' not found", []),
+        )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_rag_system_real_components_mock_ai(self, mock_anthropic_class):
+        # Sources come back with the result through the dispatch table too
+        result, sources = tool_manager.execute_tool_with_sources(
+            "search_course_content", query="data structures"
+        )
+        self.assertIn("Data structures", result)
+        self.assertIn("Tool Manager Test Course", sources[0]["text"])
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_rag_system_real_components_mock_ai(self, mock_anthropic_class):
         """Test RAGSystem with real components but mocked AI"""
         # Mock the Anthropic client
-        mock_client = Mock()
+        mock_client = AsyncMock()
         mock_anthropic_class.return_value = mock_client
 
-        # Create mock response
-        mock_response = Mock()
-        mock_response.content = [
-            Mock(text="Based on the course content, data structures are fundamental.")
-        ]
-        mock_response.stop_reason = "end_turn"
-        mock_client.messages.create.return_value = mock_response
+        mock_client.messages.create.return_value = _ANTHROPIC_MOCK_RESPONSE
 
         # Create RAG system with real vector components
-        with patch("rag_system.DocumentProcessor") as mock_doc_processor:
+        with (
+            patch("rag_system.DocumentProcessor") as mock_doc_processor,
+            patch("rag_system.VectorStore"),
+        ):
             rag_system = RAGSystem(self.config)
 
             # Replace vector store with real one
-            rag_system.vector_store = VectorStore(
-                self.chroma_path, "all-MiniLM-L6-v2", max_results=5
-            )
+            rag_system.vector_store = self.vector_store
 
             # Update tools to use real vector store
             rag_system.search_tool = CourseSearchTool(rag_system.vector_store)
@@ -270,7 +345,7 @@ class TestIntegration(unittest.TestCase):
             rag_system.vector_store.add_course_content(chunks)
 
             # Test query without tools (direct AI response)
-            response, sources = rag_system.query("What is 2 + 2?")
+            response, sources = await rag_system.query("What is 2 + 2?")
 
             # Should get AI response without sources
             self.assertEqual(
@@ -282,7 +357,7 @@ class TestIntegration(unittest.TestCase):
             # Verify AI was called correctly
             mock_client.messages.create.assert_called()
             call_args = mock_client.messages.create.call_args
-            self.assertIn("course materials", call_args.kwargs["system"])
+            self.assertIn("course materials", call_args.kwargs["system"][0]["text"])
             self.assertEqual(
                 call_args.kwargs["messages"][0]["content"],
                 "Answer this question about course materials: What is 2 + 2?",
@@ -300,15 +375,25 @@ class TestIntegration(unittest.TestCase):
         results = SearchResults.from_chroma(chroma_data)
         self.assertEqual(results.documents, ["doc1", "doc2"])
         self.assertEqual(results.metadata, [{"course": "A"}, {"course": "B"}])
-        self.assertEqual(results.distances, [0.1, 0.2])
+        self.assertIsInstance(results.distances, np.ndarray)
+        self.assertEqual(results.distances.dtype, np.float32)
+        np.testing.assert_allclose(results.distances, [0.1, 0.2])
         self.assertIsNone(results.error)
         self.assertFalse(results.is_empty())
 
+        # Results compare by value, distances included
+        self.assertEqual(results, SearchResults.from_chroma(chroma_data))
+        self.assertNotEqual(
+            results,
+            SearchResults(results.documents, results.metadata, [0.1, 0.3]),
+        )
+
         # Test empty results
         empty_chroma = {"documents": [[]], "metadatas": [[]], "distances": [[]]}
 
         empty_results = SearchResults.from_chroma(empty_chroma)
         self.assertTrue(empty_results.is_empty())
+        self.assertEqual(empty_results.distances.size, 0)
 
         # Test error results
         error_results = SearchResults.empty("Test error message")
@@ -317,8 +402,18 @@ class TestIntegration(unittest.TestCase):
 
     def test_data_persistence(self):
         """Test that data persists between VectorStore instances"""
+        # Persistence needs a real on-disk store, unlike the other tests
+        test_dir = self.enterContext(
+            tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        )
+        chroma_path = os.path.join(test_dir, "test_chroma")
+
         # Create first VectorStore instance and add data
-        vector_store1 = VectorStore(self.chroma_path, "all-MiniLM-L6-v2")
+        vector_store1 = VectorStore(
+            chroma_path,
+            "all-MiniLM-L6-v2",
+            embedding_function=self.embedding_function,
+        )
 
         course = Course(
             title="Persistence Test Course", instructor="Tester", lessons=[]
@@ -326,7 +421,11 @@ class TestIntegration(unittest.TestCase):
         vector_store1.add_course_metadata(course)
 
         # Create second VectorStore instance pointing to same path
-        vector_store2 = VectorStore(self.chroma_path, "all-MiniLM-L6-v2")
+        vector_store2 = VectorStore(
+            chroma_path,
+            "all-MiniLM-L6-v2",
+            embedding_function=self.embedding_function,
+        )
 
         # Data should be accessible from second instance
         course_count = vector_store2.get_course_count()
@@ -335,9 +434,43 @@ class TestIntegration(unittest.TestCase):
         course_titles = vector_store2.get_existing_course_titles()
         self.assertIn("Persistence Test Course", course_titles)
 
+    def test_existing_collection_config_mismatch(self):
+        """Test that an existing l2 collection is reported and its ef updated"""
+        test_dir = self.enterContext(
+            tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        )
+        chroma_path = os.path.join(test_dir, "test_chroma")
+        # A store created before the switch to inner product
+        chromadb.PersistentClient(
+            path=chroma_path, settings=Settings(anonymized_telemetry=False)
+        ).create_collection(
+            "course_content",
+            configuration={"hnsw": {"space": "l2"}},
+            embedding_function=self.embedding_function,
+        )
+
+        with self.assertLogs("vector_store", level="WARNING") as logs:
+            vector_store = VectorStore(
+                chroma_path,
+                "all-MiniLM-L6-v2",
+                embedding_function=self.embedding_function,
+                hnsw_ef=8,
+            )
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("course_content uses l2 distance instead of ip", logs.output[0])
+        hnsw = vector_store.course_content.configuration["hnsw"]
+        self.assertEqual((hnsw["space"], hnsw["ef_search"]), ("l2", 8))
+
+        # A rebuild recreates the collection with the requested space
+        vector_store.clear_all_data()
+        self.assertEqual(
+            vector_store.course_content.configuration["hnsw"]["space"], "ip"
+        )
+
     def test_concurrent_operations(self):
         """Test that multiple operations work correctly"""
-        vector_store = VectorStore(self.chroma_path, "all-MiniLM-L6-v2")
+        vector_store = self.vector_store
 
         # Add multiple courses
         courses = [
@@ -345,8 +478,7 @@ class TestIntegration(unittest.TestCase):
             Course(title="Concurrent Course B", instructor="Instructor B", lessons=[]),
         ]
 
-        for course in courses:
-            vector_store.add_course_metadata(course)
+        vector_store.add_courses(courses)
 
         # Add content for both courses
         chunks = [
@@ -375,6 +507,112 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(results_a.metadata[0]["course_title"], "Concurrent Course A")
         self.assertEqual(results_b.metadata[0]["course_title"], "Concurrent Course B")
 
+    def test_embedder_loads_on_first_use(self):
+        """Test that opening a store and reading metadata skips the model load"""
+        test_dir = self.enterContext(
+            tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        )
+
+        with patch(
+            "vector_store._get_embedder", return_value=self.embedding_function
+        ) as mock_get_embedder:
+            vector_store = VectorStore(
+                os.path.join(test_dir, "lazy_chroma"), TEST_EMBED_MODEL
+            )
+            self.assertEqual(vector_store.get_course_count(), 0)
+            mock_get_embedder.assert_not_called()
+
+            vector_store.add_course_metadata(Course(title="Lazy Course", lessons=[]))
+            mock_get_embedder.assert_called_once_with(TEST_EMBED_MODEL, None)
+
+    def test_batched_embed(self):
+        """Test that bulk adds embed all their documents in one call"""
+        courses = [Course(title=f"Batch Course {i}", lessons=[]) for i in range(3)]
+        chunks = [
+            CourseChunk(
+                content=f"Batch chunk {i}",
+                course_title="Batch Course 0",
+                chunk_index=i,
+            )
+            for i in range(5)
+        ]
+
+        with patch.object(
+            FakeEmbeddingFunction,
+            "__call__",
+            autospec=True,
+            side_effect=FakeEmbeddingFunction.__call__,
+        ) as mock_embedder:
+            self.vector_store.add_courses(courses)
+            self.vector_store.add_course_content(chunks)
+
+        # One call per collection, regardless of how many documents
+        self.assertEqual(mock_embedder.call_count, 2)
+        self.assertEqual(self.vector_store.get_course_count(), 3)
+
+    def test_bulk_add_respects_max_batch_size(self):
+        """Test that bulk adds are split to the client's maximum batch size"""
+        chunks = [
+            CourseChunk(
+                content=f"Batch chunk {i}",
+                course_title="Batch Course 0",
+                chunk_index=i,
+            )
+            for i in range(5)
+        ]
+
+        with (
+            patch.object(
+                self.vector_store.client, "get_max_batch_size", return_value=2
+            ),
+            patch.object(
+                FakeEmbeddingFunction,
+                "__call__",
+                autospec=True,
+                side_effect=FakeEmbeddingFunction.__call__,
+            ) as mock_embedder,
+        ):
+            self.vector_store.add_course_content(chunks)
+
+        self.assertEqual(mock_embedder.call_count, 3)
+        self.assertEqual(self.vector_store.course_content.count(), 5)
+
+    @unittest.skipUnless(
+        os.environ.get("REAL_EMBED"), "set REAL_EMBED=1 to load the real model"
+    )
+    def test_real_embedding_model_search(self):
+        """Test semantic search with the real sentence transformer model"""
+        test_dir = self.enterContext(
+            tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        )
+        vector_store = VectorStore(
+            os.path.join(test_dir, "real_embed"),
+            TEST_EMBED_MODEL,
+            max_results=1,
+            hnsw_ef=8,
+        )
+        vector_store.add_course_content(
+            [
+                CourseChunk(
+                    content="Neural networks learn weights through backpropagation.",
+                    course_title="Real Embedding Course",
+                    lesson_number=1,
+                    chunk_index=0,
+                ),
+                CourseChunk(
+                    content="Sourdough bread needs a starter and a long proof.",
+                    course_title="Real Embedding Course",
+                    lesson_number=2,
+                    chunk_index=1,
+                ),
+            ]
+        )
+
+        # No shared words with the matching chunk, so only semantics can match
+        results = vector_store.search("How do deep learning models train?")
+
+        self.assertEqual(results.metadata[0]["lesson_number"], 1)
+
 
 if __name__ == "__main__":
     unittest.main()
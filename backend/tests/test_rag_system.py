@@ -1,15 +1,39 @@
-import sys
-import os
-import unittest
-from unittest.mock import Mock, MagicMock, patch
+import pytest
+from unittest.mock import DEFAULT, create_autospec, patch
 from typing import List, Tuple
 
-# Add the parent directory to sys.path to import modules
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from rag_system import RAGSystem
+from ai_generator import AIGenerator
+from document_processor import DocumentProcessor
+from search_tools import ToolManager
+from session_manager import SessionManager
+from vector_store import VectorStore
+from response_cache import ResponseCache
 from models import Course, Lesson, CourseChunk
 
+# Read-only tool definitions shared by the tests
+SEARCH_TOOL_DEF = ({"name": "search_course_content"},)
+EMPTY_TOOLS = ()
+
+# Read-only source entries shared by the tests
+PYTHON_SOURCE = {
+    "text": "Python Basics - Lesson 1",
+    "link": "https://example.com/lesson1",
+}
+UNLINKED_SOURCE = {"text": "Python Basics - Lesson 1", "link": None}
+FUNDAMENTALS_SOURCE = {
+    "text": "Python Fundamentals",
+    "link": "https://course.com/python",
+}
+PROGRAMMING_SOURCE = {
+    "text": "Python Programming - Lesson 2",
+    "link": "https://example.com/python2",
+}
+ADVANCED_SOURCE = {
+    "text": "Advanced Python - Lesson 1",
+    "link": "https://example.com/advanced1",
+}
+
 
 class MockConfig:
     """Mock configuration for testing"""
@@ -19,437 +43,518 @@ class MockConfig:
         self.CHUNK_OVERLAP = 100
         self.CHROMA_PATH = "test_chroma"
         self.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+        self.EMBEDDING_ONNX_FILE = ""
         self.MAX_RESULTS = 5
         self.ANTHROPIC_API_KEY = "test_api_key"
         self.ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
         self.MAX_HISTORY = 2
-
-
-class TestRAGSystem(unittest.TestCase):
-    """Test suite for RAG system content-query handling"""
-
-    def setUp(self):
-        """Set up test fixtures"""
-        self.config = MockConfig()
-
-        # Mock all the component classes to avoid actual initialization
-        with (
-            patch("rag_system.DocumentProcessor"),
-            patch("rag_system.VectorStore"),
-            patch("rag_system.AIGenerator"),
-            patch("rag_system.SessionManager"),
-            patch("rag_system.ToolManager"),
-            patch("rag_system.CourseSearchTool"),
-            patch("rag_system.CourseOutlineTool"),
-        ):
-
-            self.rag_system = RAGSystem(self.config)
-
-        # Set up mocks for testing
-        self.setup_mocks()
-
-    def setup_mocks(self):
-        """Setup mock objects for components"""
-        self.rag_system.ai_generator = Mock()
-        self.rag_system.tool_manager = Mock()
-        self.rag_system.session_manager = Mock()
-        self.rag_system.vector_store = Mock()
-        self.rag_system.document_processor = Mock()
-
-    def test_query_without_session(self):
-        """Test query processing without session ID"""
-        # Setup mocks
-        self.rag_system.ai_generator.generate_response.return_value = (
-            "AI response about Python"
-        )
-        self.rag_system.tool_manager.get_tool_definitions.return_value = [
-            {"name": "search_course_content"}
-        ]
-        self.rag_system.tool_manager.get_last_sources.return_value = [
-            {"text": "Python Basics - Lesson 1", "link": "https://example.com/lesson1"}
-        ]
-
-        # Execute query
-        response, sources = self.rag_system.query("What is Python?")
-
-        # Verify AI generator was called correctly
-        self.rag_system.ai_generator.generate_response.assert_called_once()
-        call_args = self.rag_system.ai_generator.generate_response.call_args
-
-        # Check query parameter
-        self.assertEqual(
-            call_args.kwargs["query"],
-            "Answer this question about course materials: What is Python?",
-        )
-
-        # Check conversation history is None
-        self.assertIsNone(call_args.kwargs["conversation_history"])
-
-        # Check tools were provided
-        self.assertEqual(call_args.kwargs["tools"], [{"name": "search_course_content"}])
-        self.assertEqual(call_args.kwargs["tool_manager"], self.rag_system.tool_manager)
-
-        # Verify session manager was not used
-        self.rag_system.session_manager.get_conversation_history.assert_not_called()
-        self.rag_system.session_manager.add_exchange.assert_not_called()
-
-        # Verify sources management
-        self.rag_system.tool_manager.get_last_sources.assert_called_once()
-        self.rag_system.tool_manager.reset_sources.assert_called_once()
-
-        # Check return values
-        self.assertEqual(response, "AI response about Python")
-        self.assertEqual(
-            sources,
-            [
-                {
-                    "text": "Python Basics - Lesson 1",
-                    "link": "https://example.com/lesson1",
-                }
-            ],
-        )
-
-    def test_query_with_session(self):
-        """Test query processing with session ID"""
-        session_id = "user_session_123"
-
-        # Setup mocks
-        self.rag_system.session_manager.get_conversation_history.return_value = (
-            "Previous conversation context"
-        )
-        self.rag_system.ai_generator.generate_response.return_value = (
-            "Contextual AI response"
-        )
-        self.rag_system.tool_manager.get_tool_definitions.return_value = []
-        self.rag_system.tool_manager.get_last_sources.return_value = []
-
-        # Execute query
-        response, sources = self.rag_system.query(
-            "Follow up question", session_id=session_id
-        )
-
-        # Verify session history was retrieved
-        self.rag_system.session_manager.get_conversation_history.assert_called_once_with(
-            session_id
-        )
-
-        # Verify conversation history was passed to AI
-        call_args = self.rag_system.ai_generator.generate_response.call_args
-        self.assertEqual(
-            call_args.kwargs["conversation_history"], "Previous conversation context"
-        )
-
-        # Verify session was updated
-        self.rag_system.session_manager.add_exchange.assert_called_once_with(
-            session_id, "Follow up question", "Contextual AI response"
-        )
-
-    def test_query_with_tool_execution(self):
-        """Test query that results in tool execution"""
-        # Setup mocks to simulate tool usage
-        self.rag_system.ai_generator.generate_response.return_value = (
-            "Based on my search, Python is a programming language."
-        )
-        self.rag_system.tool_manager.get_tool_definitions.return_value = [
-            {
-                "name": "search_course_content",
-                "description": "Search course materials",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {"query": {"type": "string"}},
-                },
-            }
-        ]
-        self.rag_system.tool_manager.get_last_sources.return_value = [
-            {
-                "text": "Python Programming - Lesson 2",
-                "link": "https://example.com/python2",
-            },
-            {
-                "text": "Advanced Python - Lesson 1",
-                "link": "https://example.com/advanced1",
-            },
-        ]
-
-        response, sources = self.rag_system.query("Tell me about Python programming")
-
-        # Verify tool definitions were retrieved and provided
-        self.rag_system.tool_manager.get_tool_definitions.assert_called_once()
-
-        # Verify sources were retrieved and reset
-        self.rag_system.tool_manager.get_last_sources.assert_called_once()
-        self.rag_system.tool_manager.reset_sources.assert_called_once()
-
-        # Check that sources were returned
-        self.assertEqual(len(sources), 2)
-        self.assertEqual(sources[0]["text"], "Python Programming - Lesson 2")
-        self.assertEqual(sources[1]["link"], "https://example.com/advanced1")
-
-    def test_query_prompt_formatting(self):
-        """Test that query is properly formatted as a prompt"""
-        test_queries = [
+        self.MAX_HISTORY_TOKENS = 2000
+        self.ENABLE_RESPONSE_CACHE = False
+
+
+def answer_with_sources(text, *sources):
+    """generate_response side effect that reports sources like a tool call"""
+
+    def generate_response(**kwargs):
+        kwargs["sources"].extend(sources)
+        return text
+
+    return generate_response
+
+
+@pytest.fixture(scope="module")
+def rag_system():
+    """One patched RAGSystem with mock components, shared by the module"""
+    # Mock all the component classes to avoid actual initialization
+    with patch.multiple(
+        "rag_system",
+        DocumentProcessor=DEFAULT,
+        VectorStore=DEFAULT,
+        AIGenerator=DEFAULT,
+        SessionManager=DEFAULT,
+        ToolManager=DEFAULT,
+        CourseSearchTool=DEFAULT,
+        CourseOutlineTool=DEFAULT,
+    ):
+        rag = RAGSystem(MockConfig())
+        # Autospecs are introspected once here and reset between tests; they
+        # also check call signatures against the real classes
+        rag.ai_generator = create_autospec(AIGenerator, instance=True)
+        rag.tool_manager = create_autospec(ToolManager, instance=True)
+        rag.session_manager = create_autospec(SessionManager, instance=True)
+        rag.vector_store = create_autospec(VectorStore, instance=True)
+        rag.document_processor = create_autospec(DocumentProcessor, instance=True)
+        yield rag
+
+
+@pytest.fixture(autouse=True)
+def reset_mocks(rag_system):
+    """Give every test clean component mocks and no response cache"""
+    for component in (
+        rag_system.ai_generator,
+        rag_system.tool_manager,
+        rag_system.session_manager,
+        rag_system.vector_store,
+        rag_system.document_processor,
+    ):
+        component.reset_mock(return_value=True, side_effect=True)
+    rag_system.response_cache = None
+
+
+async def test_query_without_session(rag_system):
+    """Test query processing without session ID"""
+    # Setup mocks
+    rag_system.ai_generator.generate_response.side_effect = answer_with_sources(
+        "AI response about Python", PYTHON_SOURCE
+    )
+    rag_system.tool_manager.get_tool_definitions.return_value = SEARCH_TOOL_DEF
+
+    # Execute query
+    response, sources = await rag_system.query("What is Python?")
+
+    # Verify AI generator was called correctly
+    rag_system.ai_generator.generate_response.assert_called_once()
+    call_args = rag_system.ai_generator.generate_response.call_args
+
+    # Check query parameter
+    assert (
+        call_args.kwargs["query"]
+        == "Answer this question about course materials: What is Python?"
+    )
+
+    # Check conversation history is None
+    assert call_args.kwargs["conversation_history"] is None
+
+    # Check tools were provided
+    assert call_args.kwargs["tools"] == SEARCH_TOOL_DEF
+    assert call_args.kwargs["tool_manager"] == rag_system.tool_manager
+
+    # Verify session manager was not used
+    rag_system.session_manager.get_conversation_history.assert_not_called()
+    rag_system.session_manager.add_exchange.assert_not_called()
+
+    # Check return values
+    assert response == "AI response about Python"
+    assert sources == [PYTHON_SOURCE]
+
+
+async def test_query_with_session(rag_system):
+    """Test query processing with session ID"""
+    session_id = "user_session_123"
+
+    # Setup mocks
+    rag_system.session_manager.get_conversation_history.return_value = (
+        "Previous conversation context"
+    )
+    rag_system.ai_generator.generate_response.return_value = "Contextual AI response"
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    # Execute query
+    response, sources = await rag_system.query(
+        "Follow up question", session_id=session_id
+    )
+
+    # Verify session history was retrieved
+    rag_system.session_manager.get_conversation_history.assert_called_once_with(
+        session_id
+    )
+
+    # Verify conversation history was passed to AI
+    call_args = rag_system.ai_generator.generate_response.call_args
+    assert call_args.kwargs["conversation_history"] == "Previous conversation context"
+
+    # Verify session was updated
+    rag_system.session_manager.add_exchange.assert_called_once_with(
+        session_id, "Follow up question", "Contextual AI response"
+    )
+
+
+async def test_query_with_tool_execution(rag_system):
+    """Test query that results in tool execution"""
+    # Setup mocks to simulate tool usage
+    rag_system.tool_manager.get_tool_definitions.return_value = SEARCH_TOOL_DEF
+    rag_system.ai_generator.generate_response.side_effect = answer_with_sources(
+        "Based on my search, Python is a programming language.",
+        PROGRAMMING_SOURCE,
+        ADVANCED_SOURCE,
+    )
+
+    response, sources = await rag_system.query("Tell me about Python programming")
+
+    # Verify tool definitions were retrieved and provided
+    rag_system.tool_manager.get_tool_definitions.assert_called_once()
+
+    # Check that sources were returned
+    assert sources == [PROGRAMMING_SOURCE, ADVANCED_SOURCE]
+
+
+@pytest.mark.parametrize(
+    "query,expected_prompt",
+    [
+        (query, f"Answer this question about course materials: {query}")
+        for query in (
             "What is machine learning?",
             "How do I use pandas?",
             "Explain neural networks",
-        ]
-
-        for query in test_queries:
-            self.rag_system.ai_generator.generate_response.return_value = (
-                "Test response"
-            )
-            self.rag_system.tool_manager.get_tool_definitions.return_value = []
-            self.rag_system.tool_manager.get_last_sources.return_value = []
-
-            self.rag_system.query(query)
-
-            # Verify prompt formatting
-            call_args = self.rag_system.ai_generator.generate_response.call_args
-            expected_prompt = f"Answer this question about course materials: {query}"
-            self.assertEqual(call_args.kwargs["query"], expected_prompt)
-
-    def test_empty_sources_handling(self):
-        """Test handling when no sources are returned"""
-        self.rag_system.ai_generator.generate_response.return_value = (
-            "General knowledge response"
-        )
-        self.rag_system.tool_manager.get_tool_definitions.return_value = []
-        self.rag_system.tool_manager.get_last_sources.return_value = []
-
-        response, sources = self.rag_system.query("General knowledge question")
-
-        # Should return empty sources list
-        self.assertEqual(sources, [])
-        self.assertEqual(response, "General knowledge response")
-
-    def test_add_course_document_success(self):
-        """Test successful course document addition"""
-        # Setup mock course and chunks
-        mock_course = Course(
-            title="Test Course",
-            instructor="Test Instructor",
-            lessons=[Lesson(lesson_number=1, title="Lesson 1")],
-        )
-        mock_chunks = [
-            CourseChunk(
-                content="Chunk 1",
-                course_title="Test Course",
-                lesson_number=1,
-                chunk_index=0,
-            ),
-            CourseChunk(
-                content="Chunk 2",
-                course_title="Test Course",
-                lesson_number=1,
-                chunk_index=1,
-            ),
-        ]
-
-        self.rag_system.document_processor.process_course_document.return_value = (
-            mock_course,
-            mock_chunks,
         )
+    ],
+)
+async def test_query_prompt_formatting(rag_system, query, expected_prompt):
+    """Test that query is properly formatted as a prompt"""
+    rag_system.ai_generator.generate_response.return_value = "Test response"
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
 
-        # Execute
-        course, chunk_count = self.rag_system.add_course_document("/path/to/course.txt")
+    await rag_system.query(query)
 
-        # Verify document processing
-        self.rag_system.document_processor.process_course_document.assert_called_once_with(
-            "/path/to/course.txt"
-        )
-
-        # Verify vector store operations
-        self.rag_system.vector_store.add_course_metadata.assert_called_once_with(
-            mock_course
-        )
-        self.rag_system.vector_store.add_course_content.assert_called_once_with(
-            mock_chunks
-        )
-
-        # Check return values
-        self.assertEqual(course, mock_course)
-        self.assertEqual(chunk_count, 2)
-
-    def test_add_course_document_error_handling(self):
-        """Test error handling in course document addition"""
-        # Setup to raise exception
-        self.rag_system.document_processor.process_course_document.side_effect = (
-            Exception("Processing failed")
-        )
-
-        with patch("builtins.print") as mock_print:
-            course, chunk_count = self.rag_system.add_course_document(
-                "/path/to/bad_course.txt"
-            )
-
-        # Should handle error gracefully
-        self.assertIsNone(course)
-        self.assertEqual(chunk_count, 0)
-
-        # Verify error was logged
-        mock_print.assert_called_once()
-        self.assertIn("Error processing course document", mock_print.call_args[0][0])
-
-    def test_add_course_folder_with_clear_existing(self):
-        """Test adding course folder with clear existing option"""
-        with (
-            patch("os.path.exists", return_value=True),
-            patch(
-                "os.listdir", return_value=["course1.txt", "course2.pdf", "ignored.log"]
-            ),
-            patch("os.path.isfile", return_value=True),
-        ):
-
-            # Setup mock responses
-            mock_course1 = Course(title="Course 1", lessons=[])
-            mock_course2 = Course(title="Course 2", lessons=[])
-            mock_chunks1 = [
-                CourseChunk(content="Chunk", course_title="Course 1", chunk_index=0)
-            ]
-            mock_chunks2 = [
-                CourseChunk(content="Chunk", course_title="Course 2", chunk_index=0)
-            ]
-
-            self.rag_system.document_processor.process_course_document.side_effect = [
-                (mock_course1, mock_chunks1),
-                (mock_course2, mock_chunks2),
-            ]
-            self.rag_system.vector_store.get_existing_course_titles.return_value = []
-
-            # Execute with clear_existing=True
-            courses, chunks = self.rag_system.add_course_folder(
-                "/path/to/courses", clear_existing=True
-            )
-
-            # Verify data was cleared
-            self.rag_system.vector_store.clear_all_data.assert_called_once()
-
-            # Should process 2 files (txt and pdf, not log)
-            self.assertEqual(
-                self.rag_system.document_processor.process_course_document.call_count, 2
-            )
-
-            # Check return values
-            self.assertEqual(courses, 2)
-            self.assertEqual(chunks, 2)
-
-    def test_add_course_folder_skip_existing(self):
-        """Test that existing courses are skipped"""
-        with (
-            patch("os.path.exists", return_value=True),
-            patch("os.listdir", return_value=["existing_course.txt", "new_course.txt"]),
-            patch("os.path.isfile", return_value=True),
-        ):
-
-            # Setup mocks - first course exists, second is new
-            existing_course = Course(title="Existing Course", lessons=[])
-            new_course = Course(title="New Course", lessons=[])
-
-            self.rag_system.document_processor.process_course_document.side_effect = [
-                (existing_course, []),
-                (
-                    new_course,
-                    [
-                        CourseChunk(
-                            content="New", course_title="New Course", chunk_index=0
-                        )
-                    ],
-                ),
-            ]
-            self.rag_system.vector_store.get_existing_course_titles.return_value = [
-                "Existing Course"
-            ]
-
-            with patch("builtins.print") as mock_print:
-                courses, chunks = self.rag_system.add_course_folder("/path/to/courses")
-
-            # Should only add new course
-            self.assertEqual(courses, 1)  # Only new course added
-            self.assertEqual(chunks, 1)  # Only chunks from new course
-
-            # Verify existing course was skipped
-            mock_print.assert_any_call(
-                "Course already exists: Existing Course - skipping"
-            )
-
-    def test_get_course_analytics(self):
-        """Test course analytics retrieval"""
-        self.rag_system.vector_store.get_course_count.return_value = 3
-        self.rag_system.vector_store.get_existing_course_titles.return_value = [
-            "Course A",
-            "Course B",
-            "Course C",
-        ]
-
-        analytics = self.rag_system.get_course_analytics()
-
-        expected = {
-            "total_courses": 3,
-            "course_titles": ["Course A", "Course B", "Course C"],
-        }
-        self.assertEqual(analytics, expected)
-
-    def test_integration_query_flow(self):
-        """Test the complete query flow integration"""
-        session_id = "test_session"
-
-        # Setup realistic mock responses
-        self.rag_system.session_manager.get_conversation_history.return_value = (
-            "User: Hi\nAssistant: Hello!"
-        )
-        self.rag_system.tool_manager.get_tool_definitions.return_value = [
-            {"name": "search_course_content", "description": "Search courses"}
-        ]
-        self.rag_system.ai_generator.generate_response.return_value = (
-            "Python is a versatile programming language."
-        )
-        self.rag_system.tool_manager.get_last_sources.return_value = [
-            {"text": "Python Fundamentals", "link": "https://course.com/python"}
-        ]
-
-        # Execute complete flow
-        response, sources = self.rag_system.query(
-            "What is Python?", session_id=session_id
-        )
-
-        # Verify complete integration
-        # 1. Session history retrieved
-        self.rag_system.session_manager.get_conversation_history.assert_called_once_with(
-            session_id
-        )
-
-        # 2. AI generator called with all parameters
-        ai_call_args = self.rag_system.ai_generator.generate_response.call_args
-        self.assertEqual(
-            ai_call_args.kwargs["query"],
-            "Answer this question about course materials: What is Python?",
-        )
-        self.assertEqual(
-            ai_call_args.kwargs["conversation_history"], "User: Hi\nAssistant: Hello!"
-        )
-        self.assertEqual(
-            ai_call_args.kwargs["tools"],
-            [{"name": "search_course_content", "description": "Search courses"}],
-        )
-        self.assertEqual(
-            ai_call_args.kwargs["tool_manager"], self.rag_system.tool_manager
-        )
-
-        # 3. Sources retrieved and reset
-        self.rag_system.tool_manager.get_last_sources.assert_called_once()
-        self.rag_system.tool_manager.reset_sources.assert_called_once()
-
-        # 4. Session updated
-        self.rag_system.session_manager.add_exchange.assert_called_once_with(
-            session_id, "What is Python?", "Python is a versatile programming language."
-        )
-
-        # 5. Correct return values
-        self.assertEqual(response, "Python is a versatile programming language.")
-        self.assertEqual(
-            sources,
-            [{"text": "Python Fundamentals", "link": "https://course.com/python"}],
-        )
+    # Verify prompt formatting
+    call_args = rag_system.ai_generator.generate_response.call_args
+    assert call_args.kwargs["query"] == expected_prompt
 
 
-if __name__ == "__main__":
-    unittest.main()
+async def test_empty_sources_handling(rag_system):
+    """Test handling when no sources are returned"""
+    rag_system.ai_generator.generate_response.return_value = (
+        "General knowledge response"
+    )
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    response, sources = await rag_system.query("General knowledge question")
+
+    # Should return empty sources list
+    assert sources == []
+    assert response == "General knowledge response"
+
+
+async def test_repeated_query_served_from_response_cache(rag_system):
+    """Test that a repeated question skips the AI call and reuses sources"""
+    rag_system.response_cache = ResponseCache(
+        lambda texts: [[1.0, float(len(text))] for text in texts]
+    )
+    rag_system.ai_generator.generate_response.side_effect = answer_with_sources(
+        "Cached answer", UNLINKED_SOURCE
+    )
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    first = await rag_system.query("What is Python?")
+    second = await rag_system.query("What is Python?")
+
+    rag_system.ai_generator.generate_response.assert_called_once()
+    assert first == second
+    assert second[1] == [UNLINKED_SOURCE]
+
+
+async def test_empty_answer_not_cached(rag_system):
+    """Test that an empty answer is not served to later questions"""
+    rag_system.response_cache = ResponseCache(
+        lambda texts: [[1.0, float(len(text))] for text in texts]
+    )
+    rag_system.ai_generator.generate_response.side_effect = ["", "Real answer"]
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    await rag_system.query("What is Python?")
+    response, _ = await rag_system.query("What is Python?")
+
+    assert rag_system.ai_generator.generate_response.call_count == 2
+    assert response == "Real answer"
+
+
+async def test_query_stream_emits_text_then_sources(rag_system):
+    """Test that streamed queries yield text chunks and finish with sources"""
+
+    async def fake_stream(**kwargs):
+        for chunk in ["Python is ", "a language."]:
+            yield {"type": "text", "text": chunk}
+        kwargs["sources"].append(UNLINKED_SOURCE)
+
+    rag_system.ai_generator.stream_response.side_effect = fake_stream
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    events = [
+        event async for event in rag_system.query_stream("What is Python?", "session_1")
+    ]
+
+    assert events == [
+        {"type": "text", "text": "Python is "},
+        {"type": "text", "text": "a language."},
+        {
+            "type": "sources",
+            "sources": [UNLINKED_SOURCE],
+        },
+    ]
+    rag_system.session_manager.add_exchange.assert_called_once_with(
+        "session_1", "What is Python?", "Python is a language."
+    )
+
+
+async def test_query_stream_keeps_tool_preamble_out_of_history(rag_system):
+    """Test that text discarded after a tool round is not stored as the answer"""
+
+    async def fake_stream(**kwargs):
+        yield {"type": "text", "text": "Let me search. "}
+        yield {"type": "discard"}
+        yield {"type": "text", "text": "Python is a language."}
+
+    rag_system.ai_generator.stream_response.side_effect = fake_stream
+    rag_system.tool_manager.get_tool_definitions.return_value = EMPTY_TOOLS
+
+    events = [
+        event async for event in rag_system.query_stream("What is Python?", "session_1")
+    ]
+
+    assert {"type": "discard"} in events
+    rag_system.session_manager.add_exchange.assert_called_once_with(
+        "session_1", "What is Python?", "Python is a language."
+    )
+
+
+def test_add_course_document_success(rag_system):
+    """Test successful course document addition"""
+    # Setup mock course and chunks
+    mock_course = Course(
+        title="Test Course",
+        instructor="Test Instructor",
+        lessons=[Lesson(lesson_number=1, title="Lesson 1")],
+    )
+    mock_chunks = [
+        CourseChunk(
+            content="Chunk 1",
+            course_title="Test Course",
+            lesson_number=1,
+            chunk_index=0,
+        ),
+        CourseChunk(
+            content="Chunk 2",
+            course_title="Test Course",
+            lesson_number=1,
+            chunk_index=1,
+        ),
+    ]
+
+    rag_system.document_processor.process_course_document.return_value = (
+        mock_course,
+        mock_chunks,
+    )
+
+    # Execute
+    course, chunk_count = rag_system.add_course_document("/path/to/course.txt")
+
+    # Verify document processing
+    rag_system.document_processor.process_course_document.assert_called_once_with(
+        "/path/to/course.txt"
+    )
+
+    # Verify vector store operations
+    rag_system.vector_store.add_course_metadata.assert_called_once_with(mock_course)
+    rag_system.vector_store.add_course_content.assert_called_once_with(mock_chunks)
+
+    # Check return values
+    assert course == mock_course
+    assert chunk_count == 2
+
+
+def test_add_course_document_error_handling(rag_system, capsys):
+    """Test error handling in course document addition"""
+    # Setup to raise exception
+    rag_system.document_processor.process_course_document.side_effect = Exception(
+        "Processing failed"
+    )
+
+    course, chunk_count = rag_system.add_course_document("/path/to/bad_course.txt")
+
+    # Should handle error gracefully
+    assert course is None
+    assert chunk_count == 0
+
+    # Verify error was logged
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 1
+    assert "Error processing course document" in output[0]
+
+
+def test_adding_content_clears_response_cache(rag_system):
+    """Test that cached answers are dropped once new course content is added"""
+    rag_system.response_cache = create_autospec(ResponseCache, instance=True)
+    rag_system.document_processor.process_course_document.return_value = (
+        Course(title="Test Course", lessons=[]),
+        [],
+    )
+
+    rag_system.add_course_document("/path/to/course.txt")
+
+    rag_system.response_cache.clear.assert_called_once()
+
+
+def test_add_course_folder_with_clear_existing(rag_system, tmp_path):
+    """Test adding course folder with clear existing option"""
+    # Real (empty) files: the document processor is mocked, so only the
+    # folder listing matters
+    for file_name in ("course1.txt", "course2.pdf", "ignored.log"):
+        (tmp_path / file_name).touch()
+
+    # Setup mock responses
+    mock_course1 = Course(title="Course 1", lessons=[])
+    mock_course2 = Course(title="Course 2", lessons=[])
+    mock_chunks1 = [
+        CourseChunk(content="Chunk", course_title="Course 1", chunk_index=0)
+    ]
+    mock_chunks2 = [
+        CourseChunk(content="Chunk", course_title="Course 2", chunk_index=0)
+    ]
+
+    rag_system.document_processor.process_course_document.side_effect = [
+        (mock_course1, mock_chunks1),
+        (mock_course2, mock_chunks2),
+    ]
+    rag_system.vector_store.get_existing_course_titles.return_value = []
+
+    # Execute with clear_existing=True
+    courses, chunks = rag_system.add_course_folder(str(tmp_path), clear_existing=True)
+
+    # Verify data was cleared
+    rag_system.vector_store.clear_all_data.assert_called_once()
+
+    # Should process 2 files (txt and pdf, not log)
+    assert rag_system.document_processor.process_course_document.call_count == 2
+
+    # Both new courses are added in a single batch
+    rag_system.vector_store.add_courses.assert_called_once_with(
+        [mock_course1, mock_course2]
+    )
+    rag_system.vector_store.add_course_content.assert_called_once_with(
+        mock_chunks1 + mock_chunks2
+    )
+
+    # Check return values
+    assert courses == 2
+    assert chunks == 2
+
+
+def test_add_course_folder_skip_existing(rag_system, tmp_path, capsys):
+    """Test that existing courses are skipped"""
+    # Real (empty) files: the document processor is mocked, so only the
+    # folder listing matters
+    for file_name in ("existing_course.txt", "new_course.txt"):
+        (tmp_path / file_name).touch()
+
+    # Setup mocks - first course exists, second is new
+    existing_course = Course(title="Existing Course", lessons=[])
+    new_course = Course(title="New Course", lessons=[])
+
+    rag_system.document_processor.process_course_document.side_effect = [
+        (existing_course, []),
+        (
+            new_course,
+            [CourseChunk(content="New", course_title="New Course", chunk_index=0)],
+        ),
+    ]
+    rag_system.vector_store.get_existing_course_titles.return_value = [
+        "Existing Course"
+    ]
+
+    courses, chunks = rag_system.add_course_folder(str(tmp_path))
+
+    # Should only add new course
+    assert courses == 1  # Only new course added
+    assert chunks == 1  # Only chunks from new course
+
+    # Verify existing course was skipped
+    output = capsys.readouterr().out.splitlines()
+    assert "Course already exists: Existing Course - skipping" in output
+
+
+def test_add_course_folder_falls_back_to_per_course_adds(rag_system, tmp_path, capsys):
+    """Test that a failed batch add only loses the course that broke it"""
+    for file_name in ("good.txt", "bad.txt"):
+        (tmp_path / file_name).touch()
+
+    def process_course_document(file_path):
+        title = "Bad Course" if file_path.endswith("bad.txt") else "Good Course"
+        chunk = CourseChunk(content="Chunk", course_title=title, chunk_index=0)
+        return Course(title=title, lessons=[]), [chunk]
+
+    def add_course_metadata(course):
+        if course.title == "Bad Course":
+            raise ValueError("bad metadata")
+
+    rag_system.document_processor.process_course_document.side_effect = (
+        process_course_document
+    )
+    rag_system.vector_store.get_existing_course_titles.return_value = []
+    rag_system.vector_store.add_courses.side_effect = ValueError("batch failed")
+    rag_system.vector_store.add_course_metadata.side_effect = add_course_metadata
+
+    courses, chunks = rag_system.add_course_folder(str(tmp_path))
+
+    assert (courses, chunks) == (1, 1)
+    assert rag_system.vector_store.add_course_metadata.call_count == 2
+    output = capsys.readouterr().out
+    assert "Added new course: Good Course (1 chunks)" in output
+    assert "Added new course: Bad Course" not in output
+    assert "Error adding course Bad Course: bad metadata" in output
+
+
+def test_get_course_analytics(rag_system):
+    """Test course analytics retrieval"""
+    rag_system.vector_store.get_course_count.return_value = 3
+    rag_system.vector_store.get_existing_course_titles.return_value = [
+        "Course A",
+        "Course B",
+        "Course C",
+    ]
+
+    analytics = rag_system.get_course_analytics()
+
+    expected = {
+        "total_courses": 3,
+        "course_titles": ["Course A", "Course B", "Course C"],
+    }
+    assert analytics == expected
+
+
+async def test_integration_query_flow(rag_system):
+    """Test the complete query flow integration"""
+    session_id = "test_session"
+
+    # Setup realistic mock responses
+    rag_system.session_manager.get_conversation_history.return_value = (
+        "User: Hi\nAssistant: Hello!"
+    )
+    rag_system.tool_manager.get_tool_definitions.return_value = SEARCH_TOOL_DEF
+    rag_system.ai_generator.generate_response.side_effect = answer_with_sources(
+        "Python is a versatile programming language.", FUNDAMENTALS_SOURCE
+    )
+
+    # Execute complete flow
+    response, sources = await rag_system.query("What is Python?", session_id=session_id)
+
+    # Verify complete integration
+    # 1. Session history retrieved
+    get_history = rag_system.session_manager.get_conversation_history
+    assert get_history.call_count == 1
+    assert get_history.call_args.args == (session_id,)
+
+    # 2. AI generator called with all parameters
+    ai_call_args = rag_system.ai_generator.generate_response.call_args
+    assert (
+        ai_call_args.kwargs["query"]
+        == "Answer this question about course materials: What is Python?"
+    )
+    assert ai_call_args.kwargs["conversation_history"] == "User: Hi\nAssistant: Hello!"
+    assert ai_call_args.kwargs["tools"] == SEARCH_TOOL_DEF
+    assert ai_call_args.kwargs["tool_manager"] == rag_system.tool_manager
+
+    # 3. Sources collected for this request only
+    assert ai_call_args.kwargs["sources"] == [FUNDAMENTALS_SOURCE]
+
+    # 4. Session updated
+    add_exchange = rag_system.session_manager.add_exchange
+    assert add_exchange.call_count == 1
+    assert add_exchange.call_args.args == (
+        session_id,
+        "What is Python?",
+        "Python is a versatile programming language.",
+    )
+
+    # 5. Correct return values
+    assert response == "Python is a versatile programming language."
+    assert sources == [FUNDAMENTALS_SOURCE]
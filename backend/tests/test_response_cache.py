@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+
+from response_cache import ResponseCache
+
+# Fixed 2-d embeddings so similarity between test queries is known exactly
+EMBEDDINGS = {
+    "What is Python?": [1.0, 0.0],
+    "What's Python?": [0.99, 0.05],
+    "How do decorators work?": [0.0, 1.0],
+}
+
+
+def fake_embedding_function(texts):
+    return [EMBEDDINGS[text] for text in texts]
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test suite for the semantic ResponseCache"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.cache = ResponseCache(fake_embedding_function, max_size=2)
+        self.sources = [{"text": "Python Basics - Lesson 1", "link": None}]
+
+    def test_similar_query_hits(self):
+        """Test that a paraphrased query above the threshold returns the answer"""
+        self.cache.put(
+            self.cache.embed("What is Python?"), None, "A language", self.sources
+        )
+
+        hit = self.cache.get(self.cache.embed("What's Python?"), None)
+
+        self.assertEqual(hit, ("A language", self.sources))
+
+    def test_dissimilar_query_misses(self):
+        """Test that an unrelated query is not served from the cache"""
+        self.cache.put(
+            self.cache.embed("What is Python?"), None, "A language", self.sources
+        )
+
+        self.assertIsNone(
+            self.cache.get(self.cache.embed("How do decorators work?"), None)
+        )
+
+    def test_different_history_misses(self):
+        """Test that answers are only reused under the same conversation history"""
+        embedding = self.cache.embed("What is Python?")
+        self.cache.put(embedding, "User: Hi\nAssistant: Hello", "A language", [])
+
+        self.assertIsNone(self.cache.get(embedding, None))
+        self.assertIsNotNone(self.cache.get(embedding, "User: Hi\nAssistant: Hello"))
+
+    def test_eviction_prefers_least_popular_entry(self):
+        """Test that a full cache evicts the entry with the fewest hits"""
+        popular = self.cache.embed("What is Python?")
+        unpopular = self.cache.embed("How do decorators work?")
+        self.cache.put(popular, None, "A language", [])
+        self.cache.put(unpopular, None, "Wrappers", [])
+        self.cache.get(popular, None)
+
+        self.cache.put(self.cache.embed("What's Python?"), "other history", "New", [])
+
+        self.assertEqual(len(self.cache.entries), 2)
+        self.assertIsNotNone(self.cache.get(popular, None))
+        self.assertIsNone(self.cache.get(unpopular, None))
+
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are dropped"""
+        embedding = self.cache.embed("What is Python?")
+        with patch("response_cache.time.monotonic", return_value=0.0):
+            self.cache.put(embedding, None, "A language", [])
+
+        with patch(
+            "response_cache.time.monotonic", return_value=self.cache.ttl_seconds + 1
+        ):
+            self.assertIsNone(self.cache.get(embedding, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
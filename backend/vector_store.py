@@ -1,20 +1,42 @@
 import chromadb
+import logging
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from functools import cached_property, lru_cache
+from typing import Iterator, List, Dict, Any, Optional
 from dataclasses import dataclass
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(eq=False)
 class SearchResults:
     """Container for search results with metadata"""
 
     documents: List[str]
     metadata: List[Dict[str, Any]]
-    distances: List[float]
+    distances: np.ndarray  # float32, one per document
     error: Optional[str] = None
 
+    def __post_init__(self):
+        # One contiguous float32 array instead of a list of boxed floats;
+        # asarray does not copy when Chroma already hands back float32
+        self.distances = np.asarray(self.distances, dtype=np.float32)
+
+    def __eq__(self, other):
+        # The generated __eq__ would compare arrays elementwise and fail to
+        # reduce them to a single bool
+        if not isinstance(other, SearchResults):
+            return NotImplemented
+        return (
+            self.documents == other.documents
+            and self.metadata == other.metadata
+            and np.array_equal(self.distances, other.distances)
+            and self.error == other.error
+        )
+
     @classmethod
     def from_chroma(cls, chroma_results: Dict) -> "SearchResults":
         """Create SearchResults from ChromaDB query results"""
@@ -26,37 +48,124 @@ class SearchResults:
                 chroma_results["metadatas"][0] if chroma_results["metadatas"] else []
             ),
             distances=(
-                chroma_results["distances"][0] if chroma_results["distances"] else []
+                chroma_results["distances"][0] if chroma_results["distances"] else ()
             ),
         )
 
     @classmethod
     def empty(cls, error_msg: str) -> "SearchResults":
         """Create empty results with error message"""
-        return cls(documents=[], metadata=[], distances=[], error=error_msg)
+        return cls(documents=[], metadata=[], distances=(), error=error_msg)
 
     def is_empty(self) -> bool:
         """Check if results are empty"""
         return len(self.documents) == 0
 
 
+@lru_cache(maxsize=None)
+def _get_embedder(model_name: str, onnx_file: Optional[str] = None):
+    """
+    Load a sentence transformer embedding function once per model and backend.
+
+    When onnx_file names an ONNX export in the model repo (e.g. an int8
+    quantized one), inference runs on ONNX Runtime; if that export or
+    optimum[onnxruntime] is unavailable, the PyTorch model is used instead.
+    """
+    embedding_functions = chromadb.utils.embedding_functions
+    if onnx_file:
+        try:
+            return embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=model_name,
+                backend="onnx",
+                model_kwargs={
+                    "file_name": onnx_file,
+                    "provider": "CPUExecutionProvider",
+                },
+            )
+        except (ImportError, OSError) as e:
+            logger.warning("ONNX embedding unavailable, using PyTorch: %s", e)
+
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=model_name
+    )
+
+
+class LazySentenceTransformerEmbeddingFunction(EmbeddingFunction):
+    """
+    Sentence transformer embedding function that loads its model on first use.
+
+    Opening a store only to read metadata (course counts, titles, outlines)
+    never embeds anything, so it no longer pays for a model load. It reports
+    the same name and config as Chroma's SentenceTransformerEmbeddingFunction,
+    so existing collections open unchanged.
+    """
+
+    def __init__(self, model_name: str, onnx_file: Optional[str] = None):
+        self.model_name = model_name
+        self.onnx_file = onnx_file
+
+    @cached_property
+    def _embedder(self):
+        return _get_embedder(self.model_name, self.onnx_file)
+
+    def __call__(self, input):
+        # Unit-length vectors make inner product equal cosine similarity
+        vectors = np.asarray(self._embedder(input), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return list(vectors)
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "device": "cpu",
+            "normalize_embeddings": True,
+            "kwargs": {},
+        }
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]):
+        return LazySentenceTransformerEmbeddingFunction(config["model_name"])
+
+
 class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
 
-    def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
+    def __init__(
+        self,
+        chroma_path: Optional[str],
+        embedding_model: str,
+        max_results: int = 5,
+        embedding_function=None,
+        in_memory: bool = False,
+        hnsw_ef: Optional[int] = None,
+        onnx_file: Optional[str] = None,
+    ):
         self.max_results = max_results
-        # Initialize ChromaDB client
-        self.client = chromadb.PersistentClient(
-            path=chroma_path, settings=Settings(anonymized_telemetry=False)
-        )
-
-        # Set up sentence transformer embedding function
+        # HNSW search breadth; Chroma's default is 100
+        self.hnsw_ef = hnsw_ef
+        # Initialize ChromaDB client; in-memory clients skip the disk entirely
+        # (chroma_path is ignored) and share one store per process
+        settings = Settings(anonymized_telemetry=False)
+        if in_memory:
+            self.client = chromadb.EphemeralClient(settings=settings)
+        else:
+            self.client = chromadb.PersistentClient(path=chroma_path, settings=settings)
+
+        # Set up sentence transformer embedding function, shared between stores
+        # and loaded on first use, unless the caller supplies its own
         self.embedding_function = (
-            chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name=embedding_model
-            )
+            embedding_function
+            or LazySentenceTransformerEmbeddingFunction(embedding_model, onnx_file)
         )
 
+        # Repeated queries (course names, follow-up searches) skip re-embedding
+        self._embed_query = lru_cache(maxsize=1024)(self._embed_uncached)
+
         # Create collections for different types of data
         self.course_catalog = self._create_collection(
             "course_catalog"
@@ -67,10 +176,36 @@ class VectorStore:
 
     def _create_collection(self, name: str):
         """Create or get a ChromaDB collection"""
-        return self.client.get_or_create_collection(
-            name=name, embedding_function=self.embedding_function
+        # Embeddings are unit length, so inner product ranks like cosine with a
+        # single multiply-add per dimension
+        hnsw = {"space": "ip"}
+        if self.hnsw_ef is not None:
+            hnsw["ef_search"] = self.hnsw_ef
+        collection = self.client.get_or_create_collection(
+            name=name,
+            configuration={"hnsw": hnsw},
+            embedding_function=self.embedding_function,
         )
 
+        # An existing collection ignores the configuration above: its search
+        # breadth can be changed in place, but its space is fixed until rebuilt
+        existing = (collection.configuration or {}).get("hnsw") or {}
+        if existing.get("space", hnsw["space"]) != hnsw["space"]:
+            logger.warning(
+                "Collection %s uses %s distance instead of %s; rebuild it "
+                "(clear_existing=True) to switch",
+                name,
+                existing["space"],
+                hnsw["space"],
+            )
+        if self.hnsw_ef is not None and existing.get("ef_search") != self.hnsw_ef:
+            collection.modify(configuration={"hnsw": {"ef_search": self.hnsw_ef}})
+        return collection
+
+    def _embed_uncached(self, text: str):
+        """Embed a single query string with the store's embedding function"""
+        return self.embedding_function([text])[0]
+
     def search(
         self,
         query: str,
@@ -106,7 +241,9 @@ class VectorStore:
 
         try:
             results = self.course_content.query(
-                query_texts=[query], n_results=search_limit, where=filter_dict
+                query_embeddings=[self._embed_query(query)],
+                n_results=search_limit,
+                where=filter_dict,
             )
             return SearchResults.from_chroma(results)
         except Exception as e:
@@ -115,7 +252,9 @@ class VectorStore:
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
         try:
-            results = self.course_catalog.query(query_texts=[course_name], n_results=1)
+            results = self.course_catalog.query(
+                query_embeddings=[self._embed_query(course_name)], n_results=1
+            )
 
             if results["documents"][0] and results["metadatas"][0]:
                 # Return the title (which is now the ID)
@@ -148,9 +287,26 @@ class VectorStore:
 
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
+        self.add_courses([course])
+
+    def add_courses(self, courses: List[Course]):
+        """Add several courses to the catalog, embedding their titles in batches"""
+        for batch in self._batches(courses):
+            self.course_catalog.add(
+                documents=[course.title for course in batch],
+                metadatas=[self._course_metadata(course) for course in batch],
+                ids=[course.title for course in batch],
+            )
 
-        course_text = course.title
+    def _batches(self, items: List) -> Iterator[List]:
+        """Split items into the largest slices the client accepts in one add"""
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(items), batch_size):
+            yield items[start : start + batch_size]
+
+    def _course_metadata(self, course: Course) -> Dict[str, Any]:
+        """Build the catalog metadata for a course"""
+        import json
 
         # Build lessons metadata and serialize as JSON string
         lessons_metadata = []
@@ -177,35 +333,31 @@ class VectorStore:
         if course.course_link is not None:
             metadata["course_link"] = course.course_link
 
-        self.course_catalog.add(
-            documents=[course_text], metadatas=[metadata], ids=[course.title]
-        )
+        return metadata
 
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
-        if not chunks:
-            return
-
-        documents = [chunk.content for chunk in chunks]
-        metadatas = []
-
-        for chunk in chunks:
-            metadata = {
-                "course_title": chunk.course_title,
-                "chunk_index": chunk.chunk_index,
-            }
-            # Only add lesson_number if it's not None
-            if chunk.lesson_number is not None:
-                metadata["lesson_number"] = chunk.lesson_number
-            metadatas.append(metadata)
-
-        # Use title with chunk index for unique IDs
-        ids = [
-            f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}"
-            for chunk in chunks
-        ]
-
-        self.course_content.add(documents=documents, metadatas=metadatas, ids=ids)
+        for batch in self._batches(chunks):
+            documents = [chunk.content for chunk in batch]
+            metadatas = []
+
+            for chunk in batch:
+                metadata = {
+                    "course_title": chunk.course_title,
+                    "chunk_index": chunk.chunk_index,
+                }
+                # Only add lesson_number if it's not None
+                if chunk.lesson_number is not None:
+                    metadata["lesson_number"] = chunk.lesson_number
+                metadatas.append(metadata)
+
+            # Use title with chunk index for unique IDs
+            ids = [
+                f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}"
+                for chunk in batch
+            ]
+
+            self.course_content.add(documents=documents, metadatas=metadatas, ids=ids)
 
     def clear_all_data(self):
         """Clear all data from both collections"""
@@ -9,6 +9,12 @@ echo "1. Checking code formatting..."
 ./scripts/check-format.sh
 FORMAT_EXIT_CODE=$?
 
+# Run the test suite, spread across all CPUs with pytest-xdist
+echo ""
+echo "2. Running tests..."
+uv run --extra test pytest -n auto
+TEST_EXIT_CODE=$?
+
 echo ""
 echo "📊 Quality Check Summary:"
 echo "========================"
@@ -19,8 +25,14 @@ else
     echo "❌ Code formatting: FAILED"
 fi
 
+if [ $TEST_EXIT_CODE -eq 0 ]; then
+    echo "✅ Tests: PASSED"
+else
+    echo "❌ Tests: FAILED"
+fi
+
 echo ""
-if [ $FORMAT_EXIT_CODE -eq 0 ]; then
+if [ $FORMAT_EXIT_CODE -eq 0 ] && [ $TEST_EXIT_CODE -eq 0 ]; then
     echo "🎉 All quality checks passed!"
     exit 0
 else